@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+
+from wmzf.simulation import Simulation
+from wmzf.base.forces import FORCES, createForce
+
+# Parametry z ujemnymi wykladnikami - tak wygladaja realne stale w jednostkach SI
+PARAMETERS = {"coulomb": (), "gravity": (), "yukawa": (2e-5,), "lennard-jones": (1.65e-21, 3.4e-10)}
+
+
+class ForceRoundTrip(unittest.TestCase):
+
+    def createWorld(self, force):
+        world = Simulation(1, 0.01)
+        world.addParticle([1.0, 1.0, [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+        world.addParticle([2.0, -1.0, [10.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        world.setForce(force)
+        return world
+
+    def assertSameForce(self, loaded, force):
+        self.assertIs(type(loaded), type(force))
+        self.assertEqual(loaded.getCutoff(), force.getCutoff())
+        self.assertEqual(tuple(loaded.getParameters()), tuple(force.getParameters()))
+
+    def test_every_force_is_covered(self):
+        self.assertEqual(set(PARAMETERS), set(FORCES))
+
+    def test_save_and_load(self):
+        for name, parameters in PARAMETERS.items():
+            for cutoff in (None, 1.5e-9):
+                with self.subTest(force=name, cutoff=cutoff):
+                    force = createForce(name, cutoff, parameters)
+                    with tempfile.TemporaryDirectory() as directory:
+                        self.createWorld(force).save("scene.txt", directory)
+                        world = Simulation(1, 0.1)
+                        world.load("scene.txt", directory)
+                    self.assertSameForce(world.getForce(), force)
+
+
+class NeutralParticles(unittest.TestCase):
+
+    def test_rejected_by_charge_laws(self):
+        for name in ("coulomb", "yukawa"):
+            with self.subTest(force=name):
+                world = Simulation(1, 0.01)
+                world.setForce(createForce(name, None, PARAMETERS[name]))
+                with self.assertRaises(ValueError):
+                    world.addParticle([1.0, 0.0, [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+                with self.assertRaises(ValueError):
+                    world.addParticles([1.0, 1.0], [1.0, 0.0], [[0.0, 0.0], [1.0, 0.0]], [[0.0, 0.0], [0.0, 0.0]])
+
+    def test_accepted_by_other_laws(self):
+        for name in ("gravity", "lennard-jones"):
+            with self.subTest(force=name):
+                world = Simulation(1, 0.01)
+                world.setForce(createForce(name, None, PARAMETERS[name]))
+                world.addParticle([1.0, 0.0, [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+                world.addParticles([1.0, 1.0], [0.0, 0.0], [[5.0, 0.0], [10.0, 0.0]], [[0.0, 0.0], [0.0, 0.0]])
+                world.editParticle([2.0, 0.0, [0.0, 1.0, 0.0], [0.0, 0.0, 0.0]], 0)
+                with tempfile.TemporaryDirectory() as directory:
+                    world.save("scene.txt", directory)
+                    loaded = Simulation(1, 0.1)
+                    loaded.load("scene.txt", directory)
+                self.assertEqual(list(loaded.getCharges()), [0.0, 0.0, 0.0])
+                with self.assertRaises(ValueError):
+                    loaded.setForce(createForce("coulomb"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import numpy as np
+
+from wmzf.base.spatial import UniformGrid
+
+
+class CollisionEvent:
+
+    def __init__(self, step: int, kind: str, first: int, second: int, position, static=False):
+        self.step = step
+        self.kind = kind
+        self.first = first
+        self.second = second
+        self.position = np.array(position, dtype=float)
+        self.static = static
+
+    def __str__(self):
+        target = "static " if self.static else ""
+        return "{} step {}: {} + {}{} at {}".format(self.kind.upper(), self.step, self.first, target, self.second,
+                                                   list(self.position))
+
+
+class CollisionHandler:
+
+    def __init__(self, radius: float, mode="merge"):
+        if not radius > 0:
+            raise ValueError("Capture radius must be positive.")
+        if mode not in ("merge", "bounce"):
+            raise ValueError("Collision mode must be either 'merge' or 'bounce'.")
+        self.radius = radius
+        self.mode = mode
+
+    def detect(self, state):
+        # Jedna siatka na krok - koszt O(N) przy rozsadnym promieniu
+        count = len(state.positions)
+        points = np.concatenate((state.positions, state.sources))
+        empty = np.zeros(shape=(0,), dtype=np.int64)
+        if count == 0 or len(points) < 2:
+            return empty, empty
+
+        owners, members, distances = UniformGrid(points, self.radius).query(state.positions, self.radius)
+        unique = owners < members
+        return owners[unique], members[unique]
+
+    def handle(self, state, step: int):
+        owners, members = self.detect(state)
+        if not len(owners):
+            return [], None
+        if self.mode == "bounce":
+            return self.bounce(state, owners, members, step), None
+        return self.merge(state, owners, members, step)
+
+    def bounce(self, state, owners, members, step):
+        count = len(state.positions)
+        points = np.concatenate((state.positions, state.sources))
+        velocities = np.concatenate((state.velocities, np.zeros(shape=state.sources.shape, dtype=float)))
+        masses = state.masses
+
+        normal = points[owners] - points[members]
+        length = np.linalg.norm(normal, axis=1)
+        separated = length > 0
+        owners, members, normal = owners[separated], members[separated], normal[separated] / length[separated, None]
+        approach = np.einsum("ak,ak->a", velocities[owners] - velocities[members], normal)
+        closing = approach < 0
+        owners, members, normal, approach = owners[closing], members[closing], normal[closing], approach[closing]
+
+        # Zderzenie sprezyste wzdluz linii srodkow; czastka stacjonarna ma nieskonczona mase
+        static = members >= count
+        kinetic = ~static
+        share = np.ones(shape=(len(owners),), dtype=float)
+        share[kinetic] = masses[members[kinetic]] / (masses[owners[kinetic]] + masses[members[kinetic]])
+
+        impulse = 2 * approach[:, None] * normal
+        np.add.at(state.velocities, owners, -share[:, None] * impulse)
+        rebound = 1.0 - share[kinetic]
+        np.add.at(state.velocities, members[kinetic], rebound[:, None] * impulse[kinetic])
+
+        columns, sourcecolumns = state.getColumns(), state.getSourceColumns()
+        return [CollisionEvent(step, "bounce", int(columns[owner]),
+                               int(sourcecolumns[member - count] if member >= count else columns[member]),
+                               points[owner], member >= count) for owner, member in zip(owners, members)]
+
+    def merge(self, state, owners, members, step):
+        count = len(state.positions)
+        columns, sourcecolumns = state.getColumns(), state.getSourceColumns()
+        consumed = np.zeros(shape=(count + len(state.sources),), dtype=bool)
+        alive = np.ones(shape=(count,), dtype=bool)
+        events = []
+        absorbed = False
+
+        for owner, member in zip(owners, members):
+            if consumed[owner] or consumed[member] or not alive[owner]:
+                continue
+            consumed[owner] = consumed[member] = True
+
+            if member >= count:
+                # Stacjonarna czastka pochlania kinetyczna i pozostaje w miejscu
+                source = member - count
+                state.sourcemasses[source] += state.masses[owner]
+                state.sourcecharges[source] += state.charges[owner]
+                alive[owner] = False
+                absorbed = True
+                events.append(CollisionEvent(step, "merge", int(columns[owner]), int(sourcecolumns[source]),
+                                             state.sources[source], True))
+                continue
+
+            mass = state.masses[owner] + state.masses[member]
+            position = (state.masses[owner] * state.positions[owner] + state.masses[member] * state.positions[member]) / mass
+            momentum = state.masses[owner] * state.velocities[owner] + state.masses[member] * state.velocities[member]
+
+            state.positions[owner] = position
+            state.velocities[owner] = momentum / mass
+            state.masses[owner] = mass
+            state.charges[owner] += state.charges[member]
+            alive[member] = False
+            events.append(CollisionEvent(step, "merge", int(columns[owner]), int(columns[member]), position))
+
+        state.refresh()
+        return events, (np.flatnonzero(alive), absorbed)
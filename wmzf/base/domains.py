@@ -0,0 +1,318 @@
+import numpy as np
+from time import sleep
+
+from wmzf.base.engines import ParticleState, selectEngine
+from wmzf.base.kernels import sourceField
+from wmzf.base.profiling import profileCall
+
+RUNNING, PAUSED, CANCELLED = 0, 1, 2
+
+
+def bisect(points, weights, ranks):
+    ranks = list(ranks)
+    if len(ranks) == 1:
+        return ranks[0]
+    half = len(ranks) // 2
+    if not len(points):
+        return 0, np.inf, bisect(points, weights, ranks[:half]), bisect(points, weights, ranks[half:])
+
+    # Podzial wzdluz najdluzszej osi w miejscu, gdzie waga dzieli sie proporcjonalnie do liczby rang
+    axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+    order = np.argsort(points[:, axis], kind="stable")
+    cumulative = np.cumsum(weights[order])
+    split = int(np.searchsorted(cumulative, cumulative[-1] * half / len(ranks)))
+    split = min(max(split, 0), len(order) - 1)
+    value = points[order[split], axis]
+
+    left = points[:, axis] <= value
+    return (axis, value, bisect(points[left], weights[left], ranks[:half]),
+            bisect(points[~left], weights[~left], ranks[half:]))
+
+
+def slabs(points, weights, ranks, axis=None):
+    ranks = list(ranks)
+    if len(ranks) == 1 or not len(points):
+        return bisect(points, weights, ranks)
+    if axis is None:
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+
+    order = np.argsort(points[:, axis], kind="stable")
+    cumulative = np.cumsum(weights[order])
+    split = int(np.searchsorted(cumulative, cumulative[-1] / len(ranks)))
+    split = min(max(split, 0), len(order) - 1)
+    value = points[order[split], axis]
+
+    left = points[:, axis] <= value
+    return axis, value, ranks[0], slabs(points[~left], weights[~left], ranks[1:], axis)
+
+
+def assign(tree, points):
+    owners = np.zeros(shape=(len(points),), dtype=np.int64)
+    pending = [(tree, np.arange(len(points)))]
+    while pending:
+        node, rows = pending.pop()
+        if not isinstance(node, tuple):
+            owners[rows] = node
+            continue
+        axis, value, left, right = node
+        lower = points[rows, axis] <= value
+        pending.append((left, rows[lower]))
+        pending.append((right, rows[~lower]))
+    return owners
+
+
+class Transport:
+
+    def __init__(self, rank: int, count: int):
+        self.rank = rank
+        self.count = count
+
+    def send(self, peer: int, message):
+        raise NotImplementedError
+
+    def receive(self, peer: int):
+        raise NotImplementedError
+
+    def exchange(self, messages):
+        # Pary obslugiwane w jednym globalnym porzadku, wiec blokujace wysylki sie nie zakleszczaja
+        received = {}
+        for peer in range(self.count):
+            if peer == self.rank:
+                continue
+            if self.rank < peer:
+                self.send(peer, messages.get(peer))
+                received[peer] = self.receive(peer)
+            else:
+                received[peer] = self.receive(peer)
+                self.send(peer, messages.get(peer))
+        return received
+
+    def close(self):
+        pass
+
+
+class PipeTransport(Transport):
+
+    def __init__(self, rank: int, count: int, connections):
+        super().__init__(rank, count)
+        self.connections = connections
+
+    @staticmethod
+    def create(count: int, context=None):
+        from multiprocessing import Pipe
+        pipe = Pipe if context is None else context.Pipe
+
+        connections = [{} for rank in range(count)]
+        for first in range(count):
+            for second in range(first + 1, count):
+                connections[first][second], connections[second][first] = pipe()
+        return [PipeTransport(rank, count, connections[rank]) for rank in range(count)]
+
+    def send(self, peer: int, message):
+        self.connections[peer].send(message)
+
+    def receive(self, peer: int):
+        return self.connections[peer].recv()
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+
+
+class DomainWorld:
+
+    def __init__(self, setup):
+        self.electric = setup["electric"]
+        self.magnetic = setup["magnetic"]
+        self.externalfields = setup["externalfields"]
+        self.force = setup["force"]
+        self.interactions = setup["interactions"]
+        self.steps = setup["steps"]
+
+    def getElectric(self):
+        return self.electric
+
+    def getMagnetic(self):
+        return self.magnetic
+
+    def getExternalFields(self):
+        return self.externalfields
+
+    def getForce(self):
+        return self.force
+
+    def interacting(self):
+        return self.interactions
+
+    def getSteps(self):
+        return self.steps
+
+
+class DomainRank:
+
+    def __init__(self, transport, setup, part):
+        self.transport = transport
+        self.setup = setup
+        self.world = DomainWorld(setup)
+        self.force = setup["force"]
+        self.dimensions = setup["dimensions"]
+        self.theta = setup["theta"]
+        self.load(part)
+
+    def load(self, part, accelerations=None):
+        self.columns = part["columns"]
+        self.state = ParticleState.fromArrays(part["positions"], part["velocities"], part["masses"], part["charges"],
+                                              part["sources"], part["sourcemasses"], part["sourcecharges"],
+                                              self.dimensions, self.force, self.setup["dtype"])
+        if accelerations is not None:
+            self.state.accelerations = accelerations
+        self.engine = self.setup["engine"] or selectEngine(self.force, self.state.countKinetic() + self.state.countStatic(),
+                                                           maptolerance=self.setup["maptolerance"],
+                                                           meshtolerance=self.setup["meshtolerance"])
+        self.engine.prepare(self.state, self.world)
+
+    def unload(self, kinetic, static):
+        state = self.state
+        return {"columns": self.columns[kinetic], "positions": state.positions[kinetic],
+                "velocities": state.velocities[kinetic], "accelerations": state.accelerations[kinetic],
+                "masses": state.masses[kinetic], "charges": state.charges[kinetic], "sources": state.sources[static],
+                "sourcemasses": state.sourcemasses[static], "sourcecharges": state.sourcecharges[static]}
+
+    def getPoints(self):
+        return np.concatenate((self.state.positions, self.state.sources))
+
+    def getStrengths(self):
+        return np.concatenate((self.state.strengths, self.state.sourcestrengths))
+
+    def summarize(self):
+        points, strengths = self.getPoints(), self.getStrengths()
+        if not len(points):
+            return None
+        lower, upper = points.min(axis=0), points.max(axis=0)
+        center = (lower + upper) / 2
+        return {"lower": lower, "upper": upper, "center": center, "monopole": strengths.sum(),
+                "dipole": strengths @ (points - center)}
+
+    def isNear(self, first, second):
+        if first is None or second is None:
+            return False
+        gap = np.linalg.norm(np.maximum(0, np.maximum(first["lower"] - second["upper"], second["lower"] - first["upper"])))
+        if not self.force.isInverseSquare():
+            return gap <= self.force.getCutoff()
+        size = max(np.linalg.norm(first["upper"] - first["lower"]), np.linalg.norm(second["upper"] - second["lower"]))
+        return gap * self.theta <= size
+
+    def multipoleField(self, summary, out):
+        delta = self.state.positions - summary["center"]
+        distance = np.sqrt(np.einsum("ak,ak->a", delta, delta))
+        inverse = 1.0 / np.maximum(distance, 1e-300)**3
+        projection = delta @ summary["dipole"]
+        out += (summary["monopole"] * inverse + 3 * projection * inverse / np.maximum(distance, 1e-300)**2)[:, None] * delta
+        out -= inverse[:, None] * summary["dipole"]
+
+    def interactionField(self, out):
+        own = self.summarize()
+        summaries = self.transport.exchange({peer: own for peer in self.getPeers()})
+        near = {peer for peer, summary in summaries.items() if self.isNear(own, summary)}
+
+        points, strengths = self.getPoints(), self.getStrengths()
+        halos = self.transport.exchange({peer: (points, strengths) if peer in near else None for peer in self.getPeers()})
+
+        self.engine.interactionField(self.state, out)
+        for peer, summary in summaries.items():
+            if peer in near:
+                haloPoints, haloStrengths = halos[peer]
+                sourceField(self.state.positions, haloPoints, haloStrengths, out, kernel=self.force.weight)
+            elif summary is not None and self.force.isInverseSquare():
+                self.multipoleField(summary, out)
+
+    def acceleration(self):
+        state = self.state
+        accelerations = state.ratios[:, None] * self.engine.externalField(state, self.world)
+        if self.world.interacting():
+            field = np.zeros(shape=state.positions.shape, dtype=float)
+            self.interactionField(field)
+            accelerations += (self.force.getConstant() * state.coefficients)[:, None] * field
+        return accelerations.astype(state.dtype, copy=False)
+
+    def getPeers(self):
+        return [peer for peer in range(self.transport.count) if peer != self.transport.rank]
+
+    def rebalance(self, samplesize=1024):
+        points = self.getPoints()
+        rng = np.random.default_rng(self.transport.rank)
+        picked = points[rng.choice(len(points), size=min(samplesize, len(points)), replace=False)] if len(points) else points
+        weight = len(points) / max(len(picked), 1)
+
+        samples = self.transport.exchange({peer: (picked, weight) for peer in self.getPeers()})
+        samples[self.transport.rank] = (picked, weight)
+        ordered = [samples[rank] for rank in range(self.transport.count)]
+        allpoints = np.concatenate([sample for sample, weight in ordered])
+        allweights = np.concatenate([np.full(shape=(len(sample),), fill_value=weight) for sample, weight in ordered])
+        if not len(allpoints):
+            return
+
+        split = slabs if self.setup["method"] == "slabs" else bisect
+        tree = split(allpoints, allweights, range(self.transport.count))
+        kinetic = assign(tree, self.state.positions)
+        static = assign(tree, self.state.sources)
+
+        parts = {peer: self.unload(kinetic == peer, static == peer) for peer in self.getPeers()}
+        received = self.transport.exchange(parts)
+        received[self.transport.rank] = self.unload(kinetic == self.transport.rank, static == self.transport.rank)
+
+        merged = {key: np.concatenate([received[rank][key] for rank in range(self.transport.count)])
+                  for key in received[self.transport.rank]}
+        accelerations = merged.pop("accelerations")
+        self.load(merged, accelerations)
+
+    def proceed(self, control):
+        # Decyduje rang 0, zeby wszystkie domeny zatrzymaly sie na tym samym kroku
+        if control is None:
+            return True
+        if self.transport.rank == 0:
+            while control.value == PAUSED:
+                sleep(0.05)
+            running = control.value != CANCELLED
+            for peer in self.getPeers():
+                self.transport.send(peer, running)
+            return running
+        return self.transport.receive(0)
+
+    def run(self, store, progress=None, control=None):
+        dt = self.setup["dt"]
+        interval = self.setup["rebalance"]
+        steps = self.setup["steps"]
+        stride = self.setup["stride"]
+
+        for iteration in range(steps):
+            if not self.proceed(control):
+                break
+            if interval and iteration and iteration % interval == 0:
+                self.rebalance()
+
+            state = self.state
+            state.velocities += state.accelerations * dt / 2.0
+            state.positions += state.velocities * dt
+            if iteration % stride == 0:
+                store[iteration // stride, self.columns] = state.positions
+
+            state.time = (iteration + 1) * dt
+            state.accelerations = self.acceleration()
+            state.velocities += state.accelerations * dt / 2.0
+            if progress is not None:
+                progress.value = iteration + 1
+        store.flush()
+
+
+def runDomain(transport, setup, part, path, shape, progress=None, control=None):
+    store = np.memmap(path, dtype=setup["dtype"], mode="r+", shape=shape)
+    try:
+        rank = DomainRank(transport, setup, part)
+        if setup.get("profile") is not None:
+            profileCall(setup["profile"] + "-rank" + str(transport.rank) + ".prof", rank.run, store, progress, control)
+        else:
+            rank.run(store, progress, control)
+    finally:
+        del store
+        transport.close()
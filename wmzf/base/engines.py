@@ -0,0 +1,392 @@
+import numpy as np
+
+from wmzf.base.kernels import pairField, sourceField, nearCorrection, halfListField
+from wmzf.base.forces import CoulombForce
+from wmzf.base.mesh import StaticFieldMap, MeshSolver, deposit, interpolate, isPlanar
+from wmzf.base.spatial import UniformGrid, mortonOrder
+
+
+class ParticleState:
+
+    def __init__(self, kinetic, static, dimensions=3, force=None, dtype=float):
+        self.setArrays(np.array([particle.getInitialPosition() for particle in kinetic], dtype=float).reshape((-1, 3)),
+                       np.array([particle.getInitialVelocity() for particle in kinetic], dtype=float).reshape((-1, 3)),
+                       np.array([particle.getMass() for particle in kinetic], dtype=float),
+                       np.array([particle.getCharge() for particle in kinetic], dtype=float),
+                       np.array([particle.getInitialPosition() for particle in static], dtype=float).reshape((-1, 3)),
+                       np.array([particle.getMass() for particle in static], dtype=float),
+                       np.array([particle.getCharge() for particle in static], dtype=float),
+                       dimensions, force, dtype)
+
+    @classmethod
+    def fromArrays(cls, positions, velocities, masses, charges, sources, sourcemasses, sourcecharges, dimensions=3,
+                   force=None, dtype=float):
+        state = cls.__new__(cls)
+        state.setArrays(positions, velocities, masses, charges, sources, sourcemasses, sourcecharges, dimensions, force,
+                        dtype)
+        return state
+
+    def setArrays(self, positions, velocities, masses, charges, sources, sourcemasses, sourcecharges, dimensions, force,
+                  dtype=float):
+        force = CoulombForce() if force is None else force
+        self.force = force
+        self.dimensions = dimensions
+        self.dtype = np.dtype(dtype)
+        self.positions = np.array(positions, dtype=dtype)[:, :dimensions]
+        self.velocities = np.array(velocities, dtype=dtype)[:, :dimensions]
+        self.accelerations = np.zeros(shape=self.positions.shape, dtype=dtype)
+
+        self.masses = np.array(masses, dtype=dtype)
+        self.charges = np.array(charges, dtype=dtype)
+
+        self.time = 0.0
+        self.order = None
+        self.sourceorder = None
+
+        self.sources = np.array(sources, dtype=dtype)[:, :dimensions]
+        self.sourcecharges = np.array(sourcecharges, dtype=dtype)
+        self.sourcemasses = np.array(sourcemasses, dtype=dtype)
+        self.refresh()
+
+    def reorder(self, permutation):
+        self.positions = self.positions[permutation]
+        self.velocities = self.velocities[permutation]
+        self.accelerations = self.accelerations[permutation]
+        self.masses = self.masses[permutation]
+        self.charges = self.charges[permutation]
+        self.ratios = self.ratios[permutation]
+        self.strengths = self.strengths[permutation]
+        self.coefficients = self.coefficients[permutation]
+        self.order = permutation if self.order is None else self.order[permutation]
+
+    def sortSources(self):
+        permutation = mortonOrder(self.sources)
+        self.sourceorder = permutation if self.sourceorder is None else self.sourceorder[permutation]
+        self.sources = self.sources[permutation]
+        self.sourcecharges = self.sourcecharges[permutation]
+        self.sourcemasses = self.sourcemasses[permutation]
+        self.sourcestrengths = self.sourcestrengths[permutation]
+
+    def refresh(self):
+        self.ratios = self.charges / self.masses
+        self.strengths = self.force.strengths(self.masses, self.charges).astype(self.dtype, copy=False)
+        self.coefficients = self.force.coefficients(self.masses, self.charges).astype(self.dtype, copy=False)
+        self.sourcestrengths = self.force.strengths(self.sourcemasses, self.sourcecharges).astype(self.dtype, copy=False)
+
+    def getColumns(self):
+        return np.arange(len(self.positions)) if self.order is None else self.order
+
+    def getSourceColumns(self):
+        return np.arange(len(self.sources)) if self.sourceorder is None else self.sourceorder
+
+    def countKinetic(self):
+        return len(self.positions)
+
+    def countStatic(self):
+        return len(self.sources)
+
+
+def selectEngine(force, count, meshthreshold=20000, maptolerance=None, meshtolerance=None):
+    if force.getRangeClass() == "short":
+        return NeighbourListEngine()
+    # Siatka przybliza pole, wiec zastepuje sumowanie tylko przy podanej tolerancji
+    if force.isInverseSquare() and count >= meshthreshold and meshtolerance is not None:
+        return ParticleMeshEngine(tolerance=meshtolerance)
+    return DirectEngine(maptolerance=maptolerance)
+
+
+class DirectEngine:
+
+    def __init__(self, tile=256, mapthreshold=64, maptolerance=None, probes=256):
+        self.tile = tile
+        self.mapthreshold = mapthreshold
+        self.maptolerance = maptolerance
+        self.probes = probes
+        self.staticmap = None
+        self.force = CoulombForce()
+
+    def prepare(self, state, world):
+        self.force = world.getForce()
+        self.staticmap = None
+        # Mapa przybliza pole, wiec dziala tylko na wyrazne zyczenie z podana tolerancja
+        if self.maptolerance is None or not world.interacting() or state.countStatic() < self.mapthreshold:
+            return
+        if not state.countKinetic() or not self.force.isInverseSquare():
+            return
+
+        planar = isPlanar(state.positions, state.velocities, state.sources)
+        levels, nodes = 4, 129**2 if planar else 33**3
+        # Mapa oplaca sie dopiero, gdy jej zbudowanie jest tansze od sumowania w kazdym kroku
+        if world.getSteps() * state.countKinetic() > levels * nodes:
+            count = state.countKinetic()
+            probes = state.positions[np.random.default_rng(0).choice(count, size=min(self.probes, count), replace=False)]
+            self.staticmap = StaticFieldMap.fit(state.sources, state.sourcestrengths, state.positions, probes, planar,
+                                                self.maptolerance, levels=levels, tile=self.tile)
+
+    def setMapTolerance(self, tolerance=None):
+        if tolerance is not None and not tolerance > 0:
+            raise ValueError("Static field map tolerance must be positive.")
+        self.maptolerance = tolerance
+
+    def getMapTolerance(self):
+        return self.maptolerance
+
+    def getStaticMap(self):
+        return self.staticmap
+
+    def reorder(self, state, permutation):
+        pass
+
+    def estimateMemory(self, kinetic, static, dimensions, world):
+        # Kafel odleglosci z pomocniczymi tablicami oraz pole i przyspieszenia w float64
+        tile = min(self.tile, kinetic + static)
+        memory = tile * tile * 8 * (dimensions + 4) + kinetic * dimensions * 8 * 3
+        if self.maptolerance is not None and world.interacting() and static >= self.mapthreshold and kinetic \
+                and world.getForce().isInverseSquare():
+            levels, nodes = 4, 129**2 if dimensions == 2 else 33**3
+            if world.getSteps() * kinetic > levels * nodes:
+                memory += levels * nodes * 3 * 8 * 2
+        return memory
+
+    def interactionField(self, state, out):
+        pairField(state.positions, state.strengths, out, self.tile, self.force.weight)
+        self.staticField(state, out)
+
+    def staticField(self, state, out):
+        if self.staticmap is not None:
+            out += self.staticmap.field(state.positions)
+        else:
+            sourceField(state.positions, state.sources, state.sourcestrengths, out, self.tile, kernel=self.force.weight)
+
+    def acceleration(self, state, world):
+        accelerations = state.ratios[:, None] * self.externalField(state, world)
+        if world.interacting():
+            # Pole sumowane w float64 niezaleznie od typu stanu
+            field = np.zeros(shape=state.positions.shape, dtype=float)
+            self.interactionField(state, field)
+            accelerations += (self.force.getConstant() * state.coefficients)[:, None] * field
+        return accelerations.astype(state.dtype, copy=False)
+
+    def externalField(self, state, world):
+        electric = world.getElectric().getVector()
+        magnetic = world.getMagnetic().getVector()
+
+        for external in world.getExternalFields():
+            sampled = external.sample(state.positions, state.time)
+            if external.is_electric():
+                electric = electric + sampled
+            else:
+                magnetic = magnetic + sampled
+
+        if state.dimensions == 2:
+            # W plaszczyznie v x B to obrot predkosci o 90 stopni skalowany przez Bz
+            strength = magnetic[..., 2]
+            rotated = np.empty(shape=state.velocities.shape, dtype=float)
+            rotated[:, 0] = state.velocities[:, 1] * strength
+            rotated[:, 1] = -state.velocities[:, 0] * strength
+            return electric[..., :2] + rotated
+        return electric + np.cross(state.velocities, magnetic)
+
+
+class ParticleMeshEngine(DirectEngine):
+
+    def __init__(self, nodes=None, padding=0.25, reach=3.0, tile=256, chunk=8192, tolerance=None, probes=256,
+                 reaches=(3.0, 4.0, 6.0)):
+        super().__init__(tile)
+        self.nodes = nodes
+        self.padding = padding
+        self.reach = reach
+        self.chunk = chunk
+        self.tolerance = tolerance
+        self.probes = probes
+        self.reaches = reaches
+
+        self.solver = None
+        self.origin = None
+        self.size = None
+        self.exact = False
+
+    def prepare(self, state, world):
+        self.force = world.getForce()
+        if not self.force.isInverseSquare():
+            raise ValueError("Particle-mesh engine supports only untruncated inverse-square forces.")
+        self.solver = None
+        self.exact = False
+        if self.tolerance is not None and state.countKinetic():
+            self.fitReach(state)
+
+    def fitReach(self, state):
+        points = np.concatenate((state.positions, state.sources))
+        charges = np.concatenate((state.strengths, state.sourcestrengths))
+        count = state.countKinetic()
+        probes = state.positions[np.random.default_rng(0).choice(count, size=min(self.probes, count), replace=False)]
+
+        exact = np.zeros(shape=probes.shape, dtype=float)
+        sourceField(probes, points, charges, exact, self.tile, kernel=self.force.weight)
+        scale = np.maximum(np.linalg.norm(exact, axis=1), 1e-300)
+
+        # Jak przy mapie pola - najwezsza poprawka blizka, ktora miesci sie w tolerancji.
+        # Siatka myli sie u kazdej czastki, wiec liczy sie blad wzgledny 90% z nich, a nie najgorszy przypadek
+        for reach in self.reaches:
+            self.reach, self.solver = reach, None
+            field = np.zeros(shape=probes.shape, dtype=float)
+            self.meshField(points, charges, probes, field)
+            if np.quantile(np.linalg.norm(field - exact, axis=1) / scale, 0.9) <= self.tolerance:
+                return
+        # Szersza poprawka bywa wolniejsza od sumowania, wiec wtedy liczymy dokladnie
+        self.exact = True
+
+    def setTolerance(self, tolerance=None):
+        if tolerance is not None and not tolerance > 0:
+            raise ValueError("Particle-mesh tolerance must be positive.")
+        self.tolerance = tolerance
+
+    def getTolerance(self):
+        return self.tolerance
+
+    def getReach(self):
+        return None if self.exact else self.reach
+
+    def fitGrid(self, points):
+        dimensions = 2 if isPlanar(points) else 3
+        lower = points[:, :dimensions].min(axis=0)
+        upper = points[:, :dimensions].max(axis=0)
+
+        if self.solver is not None and self.solver.dimensions == dimensions:
+            if np.all(lower >= self.origin) and np.all(upper <= self.origin + self.size):
+                return
+
+        nodes = self.nodes or self.chooseNodes(len(points), dimensions)
+        center = (lower + upper) / 2
+        self.size = (1 + 2 * self.padding) * max(float(np.max(upper - lower)), 1e-9)
+        self.origin = center - self.size / 2
+
+        spacing = self.size / (nodes - 1)
+        self.solver = MeshSolver(spacing, nodes, dimensions, self.reach * spacing)
+
+    def estimateMemory(self, kinetic, static, dimensions, world):
+        count = kinetic + static
+        nodes = self.nodes or self.chooseNodes(count, dimensions)
+        padded = (2 * nodes)**dimensions
+        spectrum = padded // (2 * nodes) * (nodes + 1)
+        # Jadra w przestrzeni Fouriera zostaja, siatki pomocnicze istnieja tylko przy budowie i rozwiazaniu
+        kernels = dimensions * spectrum * 16
+        transient = max((dimensions + 2) * padded * 8, 2 * padded * 8 + 2 * spectrum * 16 + nodes**dimensions * dimensions * 8)
+        # Liczba sasiadow w poprawce rosnie z jej zasiegiem - przy tolerancji szacujemy najszersza
+        reach = max(self.reaches) if self.tolerance is not None else self.reach
+        pairs = int(np.ceil(64 * (reach / 3.0)**dimensions))
+        neighbours = self.chunk * pairs * 8 * (dimensions + 3) + count * (dimensions + 3) * 8 * 2
+        return super().estimateMemory(kinetic, 0, dimensions, world) + kernels + transient + neighbours
+
+    def chooseNodes(self, count, dimensions):
+        # Okolo jednej czastki na komorke, zeby poprawka krotkozasiegowa pozostala tania
+        if dimensions == 2:
+            return int(np.clip(np.ceil(1.5 * np.sqrt(count) / 32) * 32, 64, 1024))
+        return int(np.clip(np.ceil(1.5 * np.cbrt(count) / 8) * 8, 32, 96))
+
+    def interactionField(self, state, out):
+        if self.exact:
+            super().interactionField(state, out)
+            return
+        points = np.concatenate((state.positions, state.sources))
+        charges = np.concatenate((state.strengths, state.sourcestrengths))
+        self.meshField(points, charges, state.positions, out)
+
+    def meshField(self, points, charges, positions, out):
+        self.fitGrid(points)
+
+        solver = self.solver
+        dimensions = solver.dimensions
+        shape = (solver.nodes,) * dimensions
+        density = deposit(points, charges, self.origin, solver.spacing, shape)
+        grid = solver.solve(density)
+        out[:, :dimensions] += interpolate(grid, self.origin, solver.spacing, positions)
+
+        # Poprawka krotkozasiegowa (P3M) dla par blizszych niz cutoff
+        neighbours = UniformGrid(points[:, :dimensions], solver.cutoff)
+        for start in range(0, len(positions), self.chunk):
+            stop = min(start + self.chunk, len(positions))
+            owners, members, distances = neighbours.query(positions[start:stop, :dimensions], solver.cutoff)
+            nearCorrection(positions[start:stop], points, charges, owners, members, solver.cutoff, out[start:stop])
+
+
+class NeighbourListEngine(DirectEngine):
+
+    def __init__(self, skin=None, tile=256, chunk=8192):
+        super().__init__(tile)
+        self.skin = skin
+        self.chunk = chunk
+
+        self.offsets = None
+        self.neighbours = None
+        self.reference = None
+        self.rebuilds = 0
+
+    def prepare(self, state, world):
+        self.force = world.getForce()
+        if self.force.getCutoff() is None:
+            raise ValueError("Neighbour list engine needs a force law with a cutoff.")
+        self.offsets = None
+        self.rebuilds = 0
+
+    def reorder(self, state, permutation):
+        self.offsets = None
+
+    def estimateMemory(self, kinetic, static, dimensions, world):
+        # Dlugosci list zaleza od gestosci, ktorej przed startem nie znamy - przyjmujemy kilkudziesieciu sasiadow
+        pairs = 32 * kinetic
+        lists = pairs * 8 + (kinetic + 1) * 8 + kinetic * dimensions * 8
+        chunk = min(self.chunk, kinetic) * 64 * 8 * (dimensions + 3)
+        return super().estimateMemory(kinetic, 0, dimensions, world) + lists + chunk + (kinetic + static) * (dimensions + 3) * 8
+
+    def getSkin(self):
+        return 0.3 * self.force.getCutoff() if self.skin is None else self.skin
+
+    def isStale(self, state):
+        if self.offsets is None or len(self.reference) != len(state.positions):
+            return True
+        if not len(state.positions):
+            return False
+        displacement = np.einsum("ak,ak->a", state.positions - self.reference, state.positions - self.reference)
+        return np.sqrt(displacement.max()) > self.getSkin() / 2
+
+    def build(self, state, points):
+        radius = self.force.getCutoff() + self.getSkin()
+        grid = UniformGrid(points, radius)
+        count = len(state.positions)
+
+        members, counts = [], np.zeros(shape=(count,), dtype=np.int64)
+        for start in range(0, count, self.chunk):
+            stop = min(start + self.chunk, count)
+            owners, found, distances = grid.query(state.positions[start:stop], radius)
+            other = found > owners + start
+            owners, found = owners[other], found[other]
+
+            order = np.argsort(owners, kind="stable")
+            members.append(found[order])
+            counts[start:stop] = np.bincount(owners, minlength=stop - start)
+
+        # CSR: sasiedzi czastki i (o wiekszym indeksie) to neighbours[offsets[i]:offsets[i + 1]]
+        self.offsets = np.zeros(shape=(count + 1,), dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.neighbours = np.concatenate(members) if members else np.zeros(shape=(0,), dtype=np.int64)
+        self.reference = np.array(state.positions)
+        self.rebuilds += 1
+
+    def interactionField(self, state, out):
+        points = np.concatenate((state.positions, state.sources))
+        strengths = np.concatenate((state.strengths, state.sourcestrengths))
+        if self.isStale(state):
+            self.build(state, points)
+
+        for start in range(0, len(state.positions), self.chunk):
+            stop = min(start + self.chunk, len(state.positions))
+            lower, upper = self.offsets[start], self.offsets[stop]
+            owners = np.repeat(np.arange(start, stop), np.diff(self.offsets[start:stop + 1]))
+            halfListField(points, strengths, owners, self.neighbours[lower:upper], self.force.weight, out)
+
+    def getNeighbours(self, index: int):
+        return self.neighbours[self.offsets[index]:self.offsets[index + 1]]
+
+    def countRebuilds(self):
+        return self.rebuilds
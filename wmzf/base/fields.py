@@ -0,0 +1,139 @@
+import os
+import numpy as np
+
+from wmzf.base.mesh import interpolate
+
+maps = {}
+
+
+def loadMap(path):
+    path = os.path.abspath(path)
+    stamp = os.path.getmtime(path)
+
+    cached = maps.get(path)
+    if cached is None or cached[0] != stamp:
+        data = np.load(path)
+        if data.ndim not in (3, 4) or data.shape[-1] not in (2, 3):
+            raise ValueError("Field map must have shape (nx, ny[, nz], 2 or 3).")
+        if data.ndim - 1 < 2 or any(size < 2 for size in data.shape[:-1]):
+            raise ValueError("Field map needs at least two nodes along every axis.")
+        if data.shape[-1] == 2:
+            data = np.concatenate((data, np.zeros(shape=data.shape[:-1] + (1,), dtype=data.dtype)), axis=-1)
+
+        cached = (stamp, np.ascontiguousarray(data, dtype=float))
+        maps[path] = cached
+    return cached[1]
+
+
+def clearMaps():
+    maps.clear()
+
+
+class ExternalField:
+
+    def __init__(self, field: str):
+        if not field == "e" and not field == "m":
+            raise TypeError("Field must be either electric (e) or magnetic (m).")
+        self.fieldtype = field
+
+    def sample(self, positions, time: float):
+        raise NotImplementedError
+
+    def isPlanar(self):
+        return False
+
+    def inPlane(self, vector):
+        vector = np.asarray(vector)
+        if self.is_electric():
+            return not np.any(vector[..., 2])
+        return not np.any(vector[..., :2])
+
+    def is_electric(self):
+        return self.fieldtype == "e"
+
+    def is_magnetic(self):
+        return self.fieldtype == "m"
+
+
+class UniformField(ExternalField):
+
+    def __init__(self, vector, field: str):
+        super().__init__(field)
+        self.vector = np.asarray(vector, dtype=float).reshape((3,))
+
+    def sample(self, positions, time: float):
+        return np.broadcast_to(self.vector, (len(positions), 3))
+
+    def isPlanar(self):
+        return self.inPlane(self.vector)
+
+
+class GriddedField(ExternalField):
+
+    def __init__(self, path: str, origin, spacing: float, field: str, scale=1.0):
+        super().__init__(field)
+        if not spacing > 0:
+            raise ValueError("Grid spacing must be positive.")
+
+        self.path = path
+        self.grid = loadMap(path)
+        self.dimensions = self.grid.ndim - 1
+        self.origin = np.asarray(origin, dtype=float).reshape(-1)[:self.dimensions]
+        self.spacing = spacing
+        self.scale = scale
+        self.size = self.spacing * (np.array(self.grid.shape[:self.dimensions]) - 1)
+
+    def sample(self, positions, time: float):
+        values = np.zeros(shape=(len(positions), 3), dtype=float)
+        relative = positions[:, :self.dimensions] - self.origin
+        rows = np.flatnonzero(np.all((relative >= 0) & (relative <= self.size), axis=1))
+        if len(rows):
+            values[rows] = self.scale * interpolate(self.grid, self.origin, self.spacing, positions[rows])
+        return values
+
+    def isPlanar(self):
+        return self.dimensions == 2 and self.inPlane(self.grid)
+
+
+class OscillatingField(ExternalField):
+
+    def __init__(self, amplitude, frequency: float, field: str, phase=0.0, offset=(0, 0, 0)):
+        super().__init__(field)
+        self.amplitude = np.asarray(amplitude, dtype=float).reshape((3,))
+        self.offset = np.asarray(offset, dtype=float).reshape((3,))
+        self.frequency = frequency
+        self.phase = phase
+
+    def sample(self, positions, time: float):
+        vector = self.offset + self.amplitude * np.cos(2 * np.pi * self.frequency * time + self.phase)
+        return np.broadcast_to(vector, (len(positions), 3))
+
+    def isPlanar(self):
+        return self.inPlane(self.amplitude) and self.inPlane(self.offset)
+
+
+class QuadrupoleField(ExternalField):
+
+    def __init__(self, static: float, amplitude: float, frequency: float, radius: float, center=(0, 0)):
+        super().__init__("e")
+        if not radius > 0:
+            raise ValueError("Trap radius must be positive.")
+
+        self.static = static
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.radius = radius
+        self.center = np.asarray(center, dtype=float).reshape((2,))
+
+    def sample(self, positions, time: float):
+        # Pulapka Paula: phi = (U + V cos(wt)) (x^2 - y^2) / r0^2
+        voltage = self.static + self.amplitude * np.cos(2 * np.pi * self.frequency * time)
+        relative = positions[:, :2] - self.center
+
+        values = np.zeros(shape=(len(positions), 3), dtype=float)
+        values[:, 0] = -2 * voltage * relative[:, 0] / self.radius**2
+        values[:, 1] = 2 * voltage * relative[:, 1] / self.radius**2
+        return values
+
+    def isPlanar(self):
+        return True
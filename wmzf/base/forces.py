@@ -0,0 +1,150 @@
+import numpy as np
+
+from wmzf.base.kernels import COULOMB, SOFTENING
+
+GRAVITY = 6.6743e-11
+
+FORCES = {}
+
+
+def registerForce(force):
+    FORCES[force.name] = force
+    return force
+
+
+def createForce(name: str, cutoff=None, parameters=()):
+    if name not in FORCES:
+        raise ValueError("Unknown force law: " + str(name) + ".")
+    return FORCES[name](*parameters, cutoff=cutoff)
+
+
+class ForceLaw:
+
+    name = ""
+    source = "charge"
+    rangeclass = "long"
+    inversesquare = False
+
+    def __init__(self, constant: float, cutoff=None):
+        if cutoff is not None and not cutoff > 0:
+            raise ValueError("Cutoff must be positive.")
+        self.constant = constant
+        self.cutoff = cutoff
+
+    def __str__(self):
+        cutoff = 0 if self.cutoff is None else self.cutoff
+        return "FORCE N:" + self.name + " X:" + str(cutoff) + " P:" + str(list(self.getParameters()))
+
+    def getParameters(self):
+        return ()
+
+    def checkCharges(self, charges):
+        # Ladunek zerowy ma sens tylko wtedy, gdy prawo sily od niego nie zalezy
+        if self.source == "charge" and np.any(np.asarray(charges, dtype=float) == 0):
+            raise ValueError("Charge must be non-zero for the " + self.name + " force.")
+
+    def strengths(self, masses, charges):
+        if self.source == "mass":
+            return np.array(masses, dtype=float)
+        if self.source == "charge":
+            return np.array(charges, dtype=float)
+        return np.ones(shape=(len(masses),), dtype=float)
+
+    def coefficients(self, masses, charges):
+        if self.source == "charge":
+            return charges / masses
+        if self.source == "mass":
+            return np.ones(shape=(len(masses),), dtype=float)
+        return 1.0 / masses
+
+    def weight(self, squared):
+        raise NotImplementedError
+
+    def truncate(self, squared, weight):
+        if self.cutoff is None:
+            return weight
+        return np.where(squared <= self.cutoff**2, weight, 0.0)
+
+    def getConstant(self):
+        return self.constant
+
+    def getCutoff(self):
+        return self.cutoff
+
+    def getRangeClass(self):
+        return "short" if self.cutoff is not None else self.rangeclass
+
+    def isInverseSquare(self):
+        return self.inversesquare and self.cutoff is None
+
+
+@registerForce
+class CoulombForce(ForceLaw):
+
+    name = "coulomb"
+    inversesquare = True
+
+    def __init__(self, cutoff=None):
+        super().__init__(COULOMB, cutoff)
+
+    def weight(self, squared):
+        return self.truncate(squared, 1.0 / (squared * np.sqrt(squared) + SOFTENING))
+
+
+@registerForce
+class GravityForce(ForceLaw):
+
+    name = "gravity"
+    source = "mass"
+    inversesquare = True
+
+    def __init__(self, cutoff=None):
+        super().__init__(-GRAVITY, cutoff)
+
+    def weight(self, squared):
+        return self.truncate(squared, 1.0 / (squared * np.sqrt(squared) + SOFTENING))
+
+
+@registerForce
+class YukawaForce(ForceLaw):
+
+    name = "yukawa"
+    rangeclass = "short"
+
+    def __init__(self, screening: float, cutoff=None):
+        if not screening > 0:
+            raise ValueError("Screening length must be positive.")
+        super().__init__(COULOMB, 5 * screening if cutoff is None else cutoff)
+        self.screening = screening
+
+    def getParameters(self):
+        return (self.screening,)
+
+    def weight(self, squared):
+        distance = np.sqrt(squared) / self.screening
+        return self.truncate(squared, np.exp(-distance) * (1 + distance) / (squared * np.sqrt(squared) + SOFTENING))
+
+
+@registerForce
+class LennardJonesForce(ForceLaw):
+
+    name = "lennard-jones"
+    source = "unit"
+    rangeclass = "short"
+
+    def __init__(self, epsilon: float, sigma: float, cutoff=None):
+        if not epsilon > 0 or not sigma > 0:
+            raise ValueError("Lennard-Jones parameters must be positive.")
+        super().__init__(24 * epsilon, 2.5 * sigma if cutoff is None else cutoff)
+        self.epsilon = epsilon
+        self.sigma = sigma
+
+    def getParameters(self):
+        return self.epsilon, self.sigma
+
+    def weight(self, squared):
+        # F = 24 eps / r^2 * (2 (s/r)^12 - (s/r)^6) * d, zero dla pokrywajacych sie punktow
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sixth = (self.sigma**2 / squared)**3
+            weight = np.where(squared > 0, (2 * sixth - 1) * sixth / squared, 0.0)
+        return self.truncate(squared, weight)
@@ -0,0 +1,88 @@
+import numpy as np
+
+BOLTZMANN = 1.380649e-23
+
+
+def makeGenerator(seed=None):
+    if isinstance(seed, np.random.Generator):
+        return seed
+    return np.random.default_rng(seed)
+
+
+def uniformDisc(n: int, radius: float, center=(0, 0), seed=None):
+    rng = makeGenerator(seed)
+    distance = radius * np.sqrt(rng.random(n))
+    angle = 2 * np.pi * rng.random(n)
+
+    positions = np.zeros(shape=(n, 3), dtype=float)
+    positions[:, 0] = center[0] + distance * np.cos(angle)
+    positions[:, 1] = center[1] + distance * np.sin(angle)
+    return positions
+
+
+def uniformBox(n: int, size, center=(0, 0, 0), planar=True, seed=None):
+    rng = makeGenerator(seed)
+    size = np.broadcast_to(np.asarray(size, dtype=float), (3,))
+
+    positions = (rng.random((n, 3)) - 0.5) * size + np.asarray(center, dtype=float)
+    if planar:
+        positions[:, 2] = 0.0
+    return positions
+
+
+def lattice(shape, spacing: float, center=(0, 0, 0)):
+    shape = tuple(shape) + (1,) * (3 - len(shape))
+    axes = [(np.arange(count) - (count - 1) / 2) * spacing for count in shape]
+    grid = np.meshgrid(*axes, indexing="ij")
+    return np.stack([axis.reshape(-1) for axis in grid], axis=1) + np.asarray(center, dtype=float)
+
+
+def thermalVelocities(masses, temperature: float, planar=True, boltzmann=BOLTZMANN, seed=None):
+    rng = makeGenerator(seed)
+    masses = np.asarray(masses, dtype=float).reshape(-1)
+
+    sigma = np.sqrt(boltzmann * temperature / masses)
+    velocities = rng.standard_normal((len(masses), 3)) * sigma[:, None]
+    if planar:
+        velocities[:, 2] = 0.0
+    return velocities
+
+
+def twoStream(n: int, speed: float, spread=0.0, direction=(1, 0, 0), planar=True, seed=None):
+    rng = makeGenerator(seed)
+    direction = np.asarray(direction, dtype=float)
+    direction = direction / np.linalg.norm(direction)
+
+    signs = np.where(np.arange(n) % 2 == 0, 1.0, -1.0)
+    velocities = signs[:, None] * speed * direction
+    if spread > 0:
+        velocities += rng.standard_normal((n, 3)) * spread
+        if planar:
+            velocities[:, 2] = 0.0
+    return velocities
+
+
+def neutralPlasma(pairs: int, radius: float, ionmass: float, electronmass: float, charge: float,
+                  separation=None, center=(0, 0), seed=None):
+    rng = makeGenerator(seed)
+    if separation is None:
+        separation = radius / (10 * np.sqrt(max(pairs, 1)))
+
+    ions = uniformDisc(pairs, radius, center, rng)
+    angle = 2 * np.pi * rng.random(pairs)
+    electrons = np.array(ions)
+    electrons[:, 0] += separation * np.cos(angle)
+    electrons[:, 1] += separation * np.sin(angle)
+
+    positions = np.empty(shape=(2 * pairs, 3), dtype=float)
+    positions[0::2] = ions
+    positions[1::2] = electrons
+
+    masses = np.empty(shape=(2 * pairs,), dtype=float)
+    masses[0::2] = ionmass
+    masses[1::2] = electronmass
+
+    charges = np.empty(shape=(2 * pairs,), dtype=float)
+    charges[0::2] = abs(charge)
+    charges[1::2] = -abs(charge)
+    return masses, charges, positions
@@ -0,0 +1,83 @@
+import numpy as np
+
+COULOMB = 8.9875 * 10e9
+SOFTENING = 10e-6
+
+
+def coulombWeight(squared):
+    return 1.0 / (squared * np.sqrt(squared) + SOFTENING)
+
+
+def smoothWeight(squared, cutoff):
+    # Wewnatrz cutoff wielomian zszyty z 1/r^2 razem z pochodna
+    inner = (2.5 - 1.5 * squared / cutoff**2) / cutoff**3
+    outer = coulombWeight(squared)
+    return np.where(squared < cutoff**2, inner, outer)
+
+
+def splitAxes(points):
+    # Osobne, ciagle wspolrzedne - roznice i sumy ida elementowo i wektoryzuja sie takze dla float32
+    return [np.ascontiguousarray(points[:, axis]) for axis in range(points.shape[1])]
+
+
+def pairField(positions, charges, out, tile=256, kernel=coulombWeight):
+    count = len(positions)
+    axes = splitAxes(positions)
+    for start in range(0, count, tile):
+        stop = min(start + tile, count)
+
+        for other in range(start, count, tile):
+            end = min(other + tile, count)
+            deltas = [axis[start:stop, None] - axis[None, other:end] for axis in axes]
+            squared = deltas[0] * deltas[0]
+            for delta in deltas[1:]:
+                squared += delta * delta
+            weight = kernel(squared)
+            if other == start:
+                weight = np.triu(weight, 1)
+
+            forward = weight * charges[None, other:end]
+            backward = weight * charges[start:stop, None]
+            for axis, delta in enumerate(deltas):
+                out[start:stop, axis] += np.einsum("ab,ab->a", forward, delta)
+                out[other:end, axis] -= np.einsum("ab,ab->b", backward, delta)
+
+
+def sourceField(positions, sources, charges, out, tile=256, cutoff=0.0, kernel=coulombWeight):
+    axes, sourceaxes = splitAxes(positions), splitAxes(sources)
+    for start in range(0, len(positions), tile):
+        stop = min(start + tile, len(positions))
+
+        for other in range(0, len(sources), tile):
+            end = min(other + tile, len(sources))
+            deltas = [axis[start:stop, None] - sourceaxis[None, other:end] for axis, sourceaxis in zip(axes, sourceaxes)]
+            squared = deltas[0] * deltas[0]
+            for delta in deltas[1:]:
+                squared += delta * delta
+            if cutoff > 0:
+                weight = charges[None, other:end] * smoothWeight(squared, cutoff)
+            else:
+                weight = charges[None, other:end] * kernel(squared)
+            for axis, delta in enumerate(deltas):
+                out[start:stop, axis] += np.einsum("ab,ab->a", weight, delta)
+
+
+def nearCorrection(positions, sources, charges, owners, members, cutoff, out):
+    delta = positions[owners] - sources[members]
+    squared = np.einsum("ak,ak->a", delta, delta)
+    weight = charges[members] * (coulombWeight(squared) - smoothWeight(squared, cutoff))
+    for axis in range(out.shape[1]):
+        out[:, axis] += np.bincount(owners, weights=weight * delta[:, axis], minlength=len(out))
+
+
+def halfListField(points, strengths, owners, members, kernel, out):
+    # Kazda para zapisana raz (owner < member) - sila dodawana obu stronom
+    delta = points[owners] - points[members]
+    squared = np.einsum("ak,ak->a", delta, delta)
+    weight = kernel(squared)
+
+    mutual = members < len(out)
+    for axis in range(out.shape[1]):
+        out[:, axis] += np.bincount(owners, weights=strengths[members] * weight * delta[:, axis], minlength=len(out))
+        out[:, axis] -= np.bincount(members[mutual], weights=(strengths[owners] * weight * delta[:, axis])[mutual],
+                                    minlength=len(out))
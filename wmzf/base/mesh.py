@@ -0,0 +1,172 @@
+import numpy as np
+from itertools import product
+
+from wmzf.base.kernels import sourceField, nearCorrection, smoothWeight
+from wmzf.base.spatial import UniformGrid
+
+
+def interpolate(grid, origin, spacing, points):
+    dimensions = len(origin)
+    shape = np.array(grid.shape[:dimensions])
+
+    scaled = (points[:, :dimensions] - origin) / spacing
+    base = np.clip(np.floor(scaled).astype(np.int64), 0, shape - 2)
+    fraction = np.clip(scaled - base, 0.0, 1.0)
+
+    values = np.zeros(shape=(len(points),) + grid.shape[dimensions:], dtype=grid.dtype)
+    for corner in product((0, 1), repeat=dimensions):
+        corner = np.array(corner)
+        weight = np.prod(np.where(corner, fraction, 1.0 - fraction), axis=1)
+        index = tuple((base + corner).T)
+        values += weight.reshape((-1,) + (1,) * (grid.ndim - dimensions)) * grid[index]
+    return values
+
+
+def deposit(points, values, origin, spacing, shape):
+    dimensions = len(shape)
+    shape = np.array(shape)
+    strides = np.append(np.cumprod(shape[::-1])[-2::-1], 1)
+
+    scaled = (points[:, :dimensions] - origin) / spacing
+    base = np.clip(np.floor(scaled).astype(np.int64), 0, shape - 2)
+    fraction = np.clip(scaled - base, 0.0, 1.0)
+
+    density = np.zeros(shape=(int(np.prod(shape)),), dtype=float)
+    for corner in product((0, 1), repeat=dimensions):
+        corner = np.array(corner)
+        weight = np.prod(np.where(corner, fraction, 1.0 - fraction), axis=1)
+        density += np.bincount((base + corner) @ strides, weights=values * weight, minlength=len(density))
+    return density.reshape(tuple(shape))
+
+
+def isPlanar(*arrays):
+    return all(array.shape[1] < 3 or not len(array) or not np.any(array[:, 2]) for array in arrays)
+
+
+def padPoints(points):
+    if points.shape[1] == 3:
+        return points
+    padded = np.zeros(shape=(len(points), 3), dtype=points.dtype)
+    padded[:, :points.shape[1]] = points
+    return padded
+
+
+class StaticFieldMap:
+
+    def __init__(self, sources, charges, bounds, planar=True, nodes=None, levels=4, padding=0.25, tile=256, reach=3.0):
+        self.sources = padPoints(np.asarray(sources, dtype=float))
+        self.charges = np.asarray(charges, dtype=float)
+        self.dimensions = 2 if planar else 3
+        self.tile = tile
+
+        if nodes is None:
+            nodes = 129 if planar else 33
+        self.nodes = nodes
+
+        bounds = np.concatenate((self.sources, padPoints(np.asarray(bounds, dtype=float))))[:, :self.dimensions]
+        lower, upper = bounds.min(axis=0), bounds.max(axis=0)
+        center = (lower + upper) / 2
+        extent = (1 + 2 * padding) * max(float(np.max(upper - lower)), 1e-9)
+
+        self.levels = []
+        for level in range(levels):
+            size = extent * 2**level
+            spacing = size / (nodes - 1)
+            origin = center - size / 2
+            self.levels.append((origin, spacing, size))
+
+        # Jadro wygladzone ponizej cutoff jest gladkie, wiec siatka je dobrze przybliza
+        self.cutoff = reach * self.levels[0][1]
+        self.grids = [self.tabulate(origin, spacing) for origin, spacing, size in self.levels]
+        self.neighbours = UniformGrid(self.sources[:, :self.dimensions], self.cutoff)
+
+    @classmethod
+    def fit(cls, sources, charges, bounds, probes, planar=True, tolerance=1e-3, levels=4, tile=256,
+            reaches=(3.0, 6.0, 12.0)):
+        # Blad interpolacji maleje z szerokoscia poprawki blizkiej - bierzemy najwezsza, ktora miesci sie w tolerancji
+        for reach in reaches:
+            staticmap = cls(sources, charges, bounds, planar, levels=levels, tile=tile, reach=reach)
+            if staticmap.measureError(probes) <= tolerance:
+                return staticmap
+        return None
+
+    def measureError(self, positions):
+        positions = padPoints(np.asarray(positions, dtype=float))
+        if not len(positions):
+            return 0.0
+        exact = np.zeros(shape=positions.shape, dtype=float)
+        sourceField(positions, self.sources, self.charges, exact, self.tile)
+        # Odniesieniem jest RMS pola - wzgledny blad czastki tam, gdzie pola sie znosza, nic nie mowi o dokladnosci
+        error = np.linalg.norm(self.field(positions) - exact, axis=1)
+        scale = np.sqrt(np.mean(np.einsum("ak,ak->a", exact, exact)))
+        return float(np.max(error) / max(scale, 1e-300))
+
+    def tabulate(self, origin, spacing):
+        axes = [origin[axis] + spacing * np.arange(self.nodes) for axis in range(self.dimensions)]
+        mesh = np.meshgrid(*axes, indexing="ij")
+
+        points = np.zeros(shape=(mesh[0].size, 3), dtype=float)
+        for axis in range(self.dimensions):
+            points[:, axis] = mesh[axis].reshape(-1)
+
+        field = np.zeros(shape=points.shape, dtype=float)
+        sourceField(points, self.sources, self.charges, field, self.tile, self.cutoff)
+        return field.reshape((self.nodes,) * self.dimensions + (3,))
+
+    def field(self, positions):
+        dimensions = positions.shape[1]
+        positions = padPoints(positions)
+        out = np.zeros(shape=positions.shape, dtype=float)
+        pending = np.ones(shape=(len(positions),), dtype=bool)
+
+        for (origin, spacing, size), grid in zip(self.levels, self.grids):
+            relative = positions[:, :self.dimensions] - origin
+            inside = pending & np.all((relative >= 0) & (relative <= size), axis=1)
+            rows = np.flatnonzero(inside)
+            if len(rows):
+                out[rows] = interpolate(grid, origin, spacing, positions[rows])
+                pending[rows] = False
+
+        outside = np.flatnonzero(pending)
+        if len(outside):
+            exact = np.zeros(shape=(len(outside), 3), dtype=float)
+            sourceField(positions[outside], self.sources, self.charges, exact, self.tile)
+            out[outside] = exact
+
+        owners, members, distances = self.neighbours.query(positions[:, :self.dimensions], self.cutoff)
+        keep = ~pending[owners]
+        nearCorrection(positions, self.sources, self.charges, owners[keep], members[keep], self.cutoff, out)
+        return out[:, :dimensions]
+
+    def countNodes(self):
+        return sum(grid.size // 3 for grid in self.grids)
+
+    def getCutoff(self):
+        return self.cutoff
+
+
+class MeshSolver:
+
+    def __init__(self, spacing: float, nodes: int, dimensions: int, cutoff: float):
+        self.spacing = spacing
+        self.nodes = nodes
+        self.dimensions = dimensions
+        self.cutoff = cutoff
+        self.padded = (2 * nodes,) * dimensions
+
+        # Zerowe wypelnienie Hockneya - splot z jadrem jest liniowy, a nie okresowy
+        offsets = np.arange(2 * nodes)
+        offsets = np.where(offsets < nodes, offsets, offsets - 2 * nodes) * spacing
+        mesh = np.meshgrid(*([offsets] * dimensions), indexing="ij")
+        squared = sum(axis**2 for axis in mesh)
+        weight = smoothWeight(squared, cutoff)
+        self.kernels = [np.fft.rfftn(axis * weight) for axis in mesh]
+
+    def solve(self, density):
+        padded = np.zeros(shape=self.padded, dtype=float)
+        padded[(slice(0, self.nodes),) * self.dimensions] = density
+        spectrum = np.fft.rfftn(padded)
+
+        window = (slice(0, self.nodes),) * self.dimensions
+        components = [np.fft.irfftn(spectrum * kernel, s=self.padded)[window] for kernel in self.kernels]
+        return np.stack(components, axis=-1)
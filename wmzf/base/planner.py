@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from wmzf.base.engines import selectEngine
+
+PARTICLE = 1536
+MEGABYTE = 2**20
+
+
+def physicalMemory():
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def availableDisk():
+    try:
+        return shutil.disk_usage(tempfile.gettempdir()).free
+    except OSError:
+        return 0
+
+
+class MemoryPlan:
+
+    def __init__(self, dtype, stride: int, storage: str, pyramids=True):
+        self.dtype = np.dtype(dtype)
+        self.stride = stride
+        self.storage = storage
+        self.pyramids = pyramids
+
+    def __str__(self):
+        return "float{}, stride {}, {} storage, {} pyramids".format(8 * self.dtype.itemsize, self.stride, self.storage,
+                                                                   "eager" if self.pyramids else "lazy")
+
+    def copy(self, **changes):
+        values = {"dtype": self.dtype, "stride": self.stride, "storage": self.storage, "pyramids": self.pyramids}
+        values.update(changes)
+        return MemoryPlan(**values)
+
+
+class MemoryPlanner:
+
+    def __init__(self, budget=None, fraction=0.5, automatic=True, tracing=False):
+        self.budget = budget
+        self.fraction = fraction
+        self.automatic = automatic
+        self.tracing = tracing
+
+    def getBudget(self):
+        if self.budget is not None:
+            return self.budget
+        physical = physicalMemory()
+        return None if physical is None else int(physical * self.fraction)
+
+    def isAutomatic(self):
+        return self.automatic
+
+    def isTracing(self):
+        return self.tracing
+
+    def estimate(self, world, plan):
+        kinetic = sum(1 for particle in world.getParticles() if not particle.is_stationary())
+        static = world.countParticles() - kinetic
+        dimensions = 2 if world.isPlanar() else 3
+        itemsize = plan.dtype.itemsize
+        samples = -(-world.getSteps() // plan.stride)
+
+        engine = world.getEngine() or selectEngine(world.getForce(), world.countParticles(),
+                                                   maptolerance=world.getFieldMapTolerance(),
+                                                   meshtolerance=world.getMeshTolerance())
+        # Silniki spoza pakietu nie musza umiec oszacowac swojej pamieci
+        estimator = getattr(engine, "estimateMemory", None)
+        trajectories = samples * kinetic * dimensions * itemsize
+        # Stan liczony podwojnie - przestawienia i sklejanie zrodel tworza chwilowe kopie
+        estimate = {"particles": world.countParticles() * PARTICLE,
+                    "state": 2 * (kinetic * (3 * dimensions + 5) + static * (dimensions + 3)) * itemsize,
+                    "engine": estimator(kinetic, static, dimensions, world) if estimator is not None else 0,
+                    "trajectories": trajectories if plan.storage == "memory" else 0,
+                    "pyramids": int(1.25 * samples * kinetic * 2 * 8) if plan.pyramids else 0}
+        if world.getCompression():
+            # Blok dekodowany w float64 przy kodowaniu, strumien zlib i pamiec podreczna odtwarzania
+            chunk = min(samples, 256) * kinetic * dimensions * 8
+            estimate["compression"] = 4 * chunk + trajectories // 6 + min(2**26, samples * kinetic * dimensions * 8)
+        return estimate
+
+    def total(self, estimate):
+        return sum(estimate.values())
+
+    def candidates(self, world, requested):
+        yield requested
+        if not self.automatic:
+            return
+        plan = requested.copy(pyramids=False)
+        yield plan
+        if plan.storage == "memory":
+            kinetic = sum(1 for particle in world.getParticles() if not particle.is_stationary())
+            dimensions = 2 if world.isPlanar() else 3
+            size = world.getSteps() * kinetic * dimensions * plan.dtype.itemsize
+            if availableDisk() > 1.1 * size:
+                plan = plan.copy(storage="memmap")
+                yield plan
+        if plan.dtype != np.float32:
+            plan = plan.copy(dtype=np.float32)
+            yield plan
+        stride = plan.stride
+        while stride < world.getSteps():
+            stride = min(2 * stride, world.getSteps())
+            yield plan.copy(stride=stride)
+
+    def plan(self, world):
+        # Domeny zawsze zapisuja do pliku zmapowanego w pamieci
+        storage = "memmap" if world.getDomains() is not None else world.getStorage()
+        requested = MemoryPlan(world.getDataType(), world.getStride(), storage)
+        budget = self.getBudget()
+        if budget is None:
+            return requested, self.estimate(world, requested)
+
+        smallest = None
+        for plan in self.candidates(world, requested):
+            estimate = self.estimate(world, plan)
+            if self.total(estimate) <= budget:
+                return plan, estimate
+            smallest = plan, estimate
+
+        plan, estimate = smallest
+        raise MemoryError("Estimated peak memory of {:.1f} MB exceeds the budget of {:.1f} MB even with {}. "
+                          "Shorten the simulation, remove particles or raise the budget."
+                          .format(self.total(estimate) / MEGABYTE, budget / MEGABYTE, plan))
@@ -0,0 +1,104 @@
+import cProfile
+import numpy as np
+from collections import deque
+from contextlib import nullcontext
+from time import perf_counter
+
+
+def profileCall(path, function, *args):
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        profiler.dump_stats(path)
+
+
+class SectionTimer:
+
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.enter(self.name)
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.exit()
+        return False
+
+
+class FrameProfiler:
+
+    def __init__(self, history=240, edges=(0, 2, 4, 8, 11, 16, 33, 66), smoothing=0.1):
+        self.enabled = False
+        self.edges = np.append(np.array(edges, dtype=float), np.inf)
+        self.smoothing = smoothing
+
+        self.paints = deque(maxlen=history)
+        self.intervals = deque(maxlen=history)
+        self.sections = {}
+        self.current = {}
+        self.stack = []
+        self.last = None
+
+    def setEnabled(self, enabled: bool):
+        self.enabled = enabled
+        self.paints.clear()
+        self.intervals.clear()
+        self.sections.clear()
+        self.current.clear()
+        self.stack = []
+        self.last = None
+
+    def isEnabled(self):
+        return self.enabled
+
+    def measure(self, name: str):
+        return SectionTimer(self, name) if self.enabled else nullcontext()
+
+    def enter(self, name: str):
+        self.stack.append([name, perf_counter(), 0.0])
+
+    def exit(self):
+        # Czas wlasny sekcji - zagniezdzone sekcje odejmowane sa od rodzica
+        name, start, nested = self.stack.pop()
+        total = perf_counter() - start
+        self.current[name] = self.current.get(name, 0.0) + total - nested
+        if self.stack:
+            self.stack[-1][2] += total
+
+    def finishFrame(self, start: float, finish: float):
+        if not self.enabled:
+            return
+        self.paints.append(1000 * (finish - start))
+        if self.last is not None:
+            self.intervals.append(1000 * (start - self.last))
+        self.last = start
+
+        for name in set(self.sections) | set(self.current):
+            elapsed = 1000 * self.current.get(name, 0.0)
+            previous = self.sections.get(name, elapsed)
+            self.sections[name] = previous + self.smoothing * (elapsed - previous)
+        self.current.clear()
+
+    def getSections(self):
+        return sorted(self.sections.items(), key=lambda item: -item[1])
+
+    def getHistogram(self, samples):
+        return np.histogram(np.asarray(samples, dtype=float), bins=self.edges)[0]
+
+    def getStatistics(self, samples):
+        if not len(samples):
+            return 0.0, 0.0, 0.0
+        samples = np.asarray(samples, dtype=float)
+        return float(samples.mean()), float(np.percentile(samples, 95)), float(samples.max())
+
+    def getPaintTimes(self):
+        return self.paints
+
+    def getIntervals(self):
+        return self.intervals
+
+    def getEdges(self):
+        return self.edges
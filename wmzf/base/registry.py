@@ -0,0 +1,108 @@
+class ParticleRegistry:
+
+    def __init__(self):
+        self.entries = {}
+        self.identifiers = {}
+        self.positions = {}
+        self.nextid = 0
+
+        self.order = None
+        self.indices = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    def __contains__(self, particle):
+        return id(particle) in self.identifiers
+
+    def positionKey(self, position):
+        return tuple(float(value) for value in position)
+
+    def add(self, particle):
+        identifier = self.nextid
+        self.nextid += 1
+
+        self.entries[identifier] = particle
+        self.identifiers[id(particle)] = identifier
+        self.positions.setdefault(self.positionKey(particle.getInitialPosition()), set()).add(identifier)
+        self.invalidate()
+        return identifier
+
+    def extend(self, particles, keys):
+        for particle, key in zip(particles, keys):
+            identifier = self.nextid
+            self.nextid += 1
+
+            self.entries[identifier] = particle
+            self.identifiers[id(particle)] = identifier
+            self.positions.setdefault(key, set()).add(identifier)
+        self.invalidate()
+
+    def remove(self, particle):
+        identifier = self.identifiers.pop(id(particle))
+        del self.entries[identifier]
+        self.discardPosition(identifier, particle.getInitialPosition())
+        self.invalidate()
+        return identifier
+
+    def replace(self, index, replacement):
+        particle = self.getParticles()[index]
+        identifier = self.identifiers.pop(id(particle))
+        self.discardPosition(identifier, particle.getInitialPosition())
+
+        self.entries[identifier] = replacement
+        self.identifiers[id(replacement)] = identifier
+        self.positions.setdefault(self.positionKey(replacement.getInitialPosition()), set()).add(identifier)
+        self.invalidate()
+
+    def discardPosition(self, identifier, position):
+        key = self.positionKey(position)
+        occupants = self.positions.get(key)
+        if occupants is not None:
+            occupants.discard(identifier)
+            if not occupants:
+                del self.positions[key]
+
+    def clear(self):
+        self.entries = {}
+        self.identifiers = {}
+        self.positions = {}
+        self.invalidate()
+
+    def invalidate(self):
+        self.order = None
+        self.indices = None
+
+    def findOccupants(self, position):
+        return [self.entries[identifier] for identifier in self.positions.get(self.positionKey(position), ())]
+
+    def findDuplicate(self, particle):
+        for occupant in self.findOccupants(particle.getInitialPosition()):
+            if occupant == particle:
+                return occupant
+        return None
+
+    def isOccupied(self, position):
+        return self.positionKey(position) in self.positions
+
+    def isOccupiedKey(self, key):
+        return key in self.positions
+
+    def getParticles(self):
+        if self.order is None:
+            self.order = list(self.entries.values())
+        return self.order
+
+    def getIndex(self, particle):
+        if self.indices is None:
+            self.indices = {id(member): index for index, member in enumerate(self.getParticles())}
+        return self.indices.get(id(particle))
+
+    def getIdentifier(self, particle):
+        return self.identifiers.get(id(particle))
+
+    def getById(self, identifier):
+        return self.entries.get(identifier)
@@ -8,7 +8,7 @@ class ListParser:
             raise TypeError("[ERROR] Argument must be a string.")
         self.string = string
         self.illegal_characters = " \n\t\'\"()[]{}_;:!?*~`*/\\+"
-        self.clearup_characters = "-."
+        self.clearup_characters = "."
 
     def parse(self):
         for character in self.illegal_characters:
@@ -20,12 +20,12 @@ class ListParser:
             substring = list(self.string[i])
             if not len(substring):
                 continue
-            negative = (substring[0] == "-")
+            # Minus zostaje na poczatku liczby i zaraz po wykladniku (1.65e-21)
+            substring = [character for position, character in enumerate(substring)
+                         if character != "-" or position == 0 or substring[position - 1] in "eE"]
             for character in self.clearup_characters:
-                while substring.count(character) > self.clearup_characters.index(character):
+                while substring.count(character) > 1:
                     substring.remove(character)
-            if negative:
-                substring.insert(0, "-")
             substring = "".join(substring)
             self.string[i] = substring
 
@@ -40,17 +40,27 @@ class ListParser:
 
 class SimulationParser:
 
+    nameset = ("PARTICLE", "FIELD", "SIMULATION", "FORCE")
+    keysets = (("M", "C", "R", "V", "S"), ("E", "M"), ("T", "P", "I"), ("N", "X", "P"))
+    textkeys = ("N",)
+
     def __init__(self, line: str):
-        nameset = ("PARTICLE", "FIELD", "SIMULATION")
-        keysets = (("M", "C", "R", "V", "S"), ("E", "M"), ("T", "P", "I"))
-        keyset = nameset.index(line[:line.index(" ")])
+        self.element = line[:line.index(" ")] if " " in line else line.strip()
 
-        if keyset < 0:
+        if self.element not in self.nameset:
             raise TypeError("[ERROR] Undefined element.")
-        if not all((key in line[line.index(" "):]) for key in keysets[keyset]):
+        keyset = self.nameset.index(self.element)
+        if not all((key in line[line.index(" "):]) for key in self.keysets[keyset]):
             raise ValueError("[ERROR] Broken line.")
         self.line = line.replace("\n", "")
-        self.keys = keysets[keyset]
+        self.keys = self.keysets[keyset]
+
+    @classmethod
+    def isKnown(cls, line: str):
+        return line[:line.index(" ")] in cls.nameset if " " in line else False
+
+    def getElement(self):
+        return self.element
 
     def parse(self):
         values = []
@@ -62,11 +72,15 @@ class SimulationParser:
         if "" in self.line:
             self.line.remove("")
 
+        textual = []
         for i in range(len(self.line)):
             colon = self.line[i].index(":") + 1
             values.append(self.line[i][colon:])
+            textual.append(self.line[i][:colon - 1] in self.textkeys)
 
         for i in range(len(values)):
+            if textual[i]:
+                continue
             try:
                 values[i] = float(values[i])
             except ValueError:
@@ -103,7 +117,8 @@ class SimulationSaver:
         if self.name in directory:
             self.name = "simulation-" + datetime.datetime.now().strftime("%H-%M-%S-%d-%m-%Y") + ".txt"
 
-    def save(self, world):
+    @staticmethod
+    def serialize(world):
         fields = (world.getElectric(), world.getMagnetic())
         particles = tuple(world.getParticles())
 
@@ -112,17 +127,19 @@ class SimulationSaver:
         for field in fields:
             fieldstring += str(field) + " "
         fieldstring = fieldstring[:-1]
+        forcestring = str(world.getForce())
 
-        particlelines = []
+        lines = [paramstring, fieldstring, forcestring]
         for particle in particles:
-            particlelines.append(str(particle))
+            lines.append(str(particle))
+        return "\n".join(lines) + "\n"
 
+    def save(self, world):
+        content = self.serialize(world)
         try:
             with open(self.destination, "w") as simfile:
-                simfile.write(paramstring + "\n")
-                simfile.write(fieldstring + "\n")
-                for line in particlelines:
-                    simfile.write(line + "\n")
+                simfile.write(content)
+            world.saveTrajectories(os.path.splitext(self.destination)[0] + ".trajectory")
         except IOError:
             print("[ERROR] Could not write to file", self.destination)
 
@@ -134,27 +151,56 @@ class SimulationLoader:
         if name == "" or name not in directory:
             raise IOError("[ERROR] No such file.")
         else:
-            self.source = int(path != ".")*(path + int(path.endswith("/"))*"/") + name
+            self.source = int(path != ".")*(path + int(not path.endswith("/"))*"/") + name
             self.data = None
+            self.elements = None
+
+    @staticmethod
+    def loads(text: str):
+        loader = SimulationLoader.__new__(SimulationLoader)
+        loader.source = None
+        loader.data = text.splitlines(True)
+        loader.elements = None
+        loader.checkData()
+        loader.parseData()
+        return loader
 
     def load(self):
         self.loadFile()
+        return self.parseData()
+
+    def parseData(self):
         if self.data is not None:
-            for i in range(len(self.data)):
-                line = self.data[i]
+            # Nieznane typy linii sa pomijane, zeby starsze wersje czytaly nowsze pliki
+            lines = [line for line in self.data if SimulationParser.isKnown(line)]
+            self.data = []
+            self.elements = []
+            for line in lines:
                 parser = SimulationParser(line)
-                self.data[i] = parser.parse()
+                self.data.append(parser.parse())
+                self.elements.append(parser.getElement())
             return self.data
         else:
             return None
 
+    def getElements(self):
+        return self.elements
+
     def loadFile(self):
         try:
             with open(self.source) as simfile:
                 self.data = simfile.readlines()
         except IOError:
             print("[ERROR] Could not read file", self.source)
+        self.checkData()
+
+    def getData(self):
+        return self.data
+
+    def getSource(self):
+        return self.source
 
+    def checkData(self):
         if not self.data[0].startswith("SIMULATION"):
             raise AttributeError("[ERROR] Invalid data format - no simulation parameters")
         if not any(line.startswith("PARTICLE") for line in self.data):
@@ -0,0 +1,131 @@
+import numpy as np
+from itertools import product
+
+MAXCELLS = 2**62
+
+
+def spreadBits(values, dimensions: int):
+    values = values.astype(np.uint64)
+    if dimensions == 2:
+        masks = ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                 (2, 0x3333333333333333), (1, 0x5555555555555555))
+    else:
+        masks = ((32, 0x001F00000000FFFF), (16, 0x001F0000FF0000FF), (8, 0x100F00F00F00F00F),
+                 (4, 0x10C30C30C30C30C3), (2, 0x1249249249249249))
+    for shift, mask in masks:
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def mortonKeys(points):
+    points = np.asarray(points, dtype=float)
+    dimensions = points.shape[1]
+    bits = 32 if dimensions == 2 else 21
+    keys = np.zeros(shape=(len(points),), dtype=np.uint64)
+    if not len(points):
+        return keys
+
+    lower = points.min(axis=0)
+    extent = max(float(np.max(points.max(axis=0) - lower)), 1e-300)
+    cells = np.clip((points - lower) / extent * (2**bits - 1), 0, 2**bits - 1)
+    for axis in range(dimensions):
+        keys |= spreadBits(cells[:, axis], dimensions) << np.uint64(axis)
+    return keys
+
+
+def mortonOrder(points):
+    return np.argsort(mortonKeys(points), kind="stable")
+
+
+class UniformGrid:
+
+    def __init__(self, points, cellsize: float):
+        if not cellsize > 0:
+            raise ValueError("Cell size must be positive.")
+
+        self.points = np.asarray(points, dtype=float)
+        self.cellsize = cellsize
+        self.dimensions = self.points.shape[1] if self.points.ndim == 2 else 2
+
+        if len(self.points):
+            self.origin = self.points.min(axis=0)
+            self.cellsize = self.fitCellSize(cellsize, self.points.max(axis=0) - self.origin)
+            cells = self.locate(self.points)
+            self.shape = cells.max(axis=0) + 1
+        else:
+            self.origin = np.zeros(shape=(self.dimensions,), dtype=float)
+            self.shape = np.ones(shape=(self.dimensions,), dtype=np.int64)
+
+        self.strides = np.ones(shape=(self.dimensions,), dtype=np.int64)
+        for axis in range(self.dimensions - 2, -1, -1):
+            self.strides[axis] = self.strides[axis + 1] * self.shape[axis + 1]
+
+        keys = self.linearize(self.locate(self.points)) if len(self.points) else np.zeros(shape=(0,), dtype=np.int64)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def fitCellSize(self, cellsize, extent):
+        # Klucze komorek musza zmiescic sie w int64 - zbyt drobna siatka jest zgrubiana, zapytania pozostaja dokladne
+        while np.prod(np.floor(extent / cellsize) + 1) > MAXCELLS:
+            cellsize *= 2
+        return cellsize
+
+    def locate(self, points):
+        return np.floor((points - self.origin) / self.cellsize).astype(np.int64)
+
+    def linearize(self, cells):
+        return cells @ self.strides
+
+    def candidates(self, queries, radius: float):
+        queries = np.asarray(queries, dtype=float).reshape((-1, self.dimensions))
+        empty = np.zeros(shape=(0,), dtype=np.int64)
+        if not len(queries) or not len(self.points):
+            return empty, empty
+
+        reach = int(np.ceil(radius / self.cellsize))
+        cells = self.locate(queries)
+        owners, members = [], []
+
+        for offset in product(range(-reach, reach + 1), repeat=self.dimensions):
+            neighbours = cells + np.array(offset, dtype=np.int64)
+            inside = np.all((neighbours >= 0) & (neighbours < self.shape), axis=1)
+            rows = np.flatnonzero(inside)
+            if not len(rows):
+                continue
+
+            keys = self.linearize(neighbours[rows])
+            lower = np.searchsorted(self.keys, keys, side="left")
+            upper = np.searchsorted(self.keys, keys, side="right")
+            counts = upper - lower
+            total = counts.sum()
+            if not total:
+                continue
+
+            starts = np.repeat(lower - np.cumsum(counts) + counts, counts)
+            owners.append(np.repeat(rows, counts))
+            members.append(self.order[starts + np.arange(total)])
+
+        if not owners:
+            return empty, empty
+        return np.concatenate(owners), np.concatenate(members)
+
+    def query(self, queries, radius: float):
+        queries = np.asarray(queries, dtype=float).reshape((-1, self.dimensions))
+        owners, members = self.candidates(queries, radius)
+        distances = np.linalg.norm(queries[owners] - self.points[members], axis=1)
+        close = distances <= radius
+        return owners[close], members[close], distances[close]
+
+    def pairs(self, radius: float):
+        owners, members, distances = self.query(self.points, radius)
+        unique = owners < members
+        return owners[unique], members[unique], distances[unique]
+
+    def nearest(self, point, radius: float):
+        owners, members, distances = self.query(point, radius)
+        if not len(members):
+            return -1
+        return int(members[np.argmin(distances)])
+
+    def countPoints(self):
+        return len(self.points)
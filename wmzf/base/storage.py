@@ -0,0 +1,281 @@
+import zlib
+import numpy as np
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+LEVELS = 65534
+MISSING = 65535
+
+
+def loadArena(path: str):
+    # Zapis bez kompresji trzyma surowy bufor, skompresowany - bloki zlib
+    with np.load(path) as archive:
+        compressed = "data" in archive.files
+    return CompressedArena.load(path) if compressed else TrajectoryArena.load(path)
+
+
+class TrajectoryArena:
+
+    def __init__(self, samples: int, count: int, dimensions=3, dtype=float, path=None, shared=False):
+        if samples < 1 or count < 0:
+            raise ValueError("Arena must hold at least one sample.")
+        shape = (samples, count, dimensions)
+        self.path = path
+        self.memory = None
+        self.stride = 1
+        self.fingerprint = None
+        if shared:
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+            self.buffer = np.ndarray(shape=shape, dtype=dtype, buffer=self.memory.buf)
+        elif path is None:
+            self.buffer = np.empty(shape=shape, dtype=dtype)
+        else:
+            self.buffer = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+
+    @classmethod
+    def attach(cls, name: str, shape, dtype=float, path=None):
+        arena = cls.__new__(cls)
+        arena.path = path
+        arena.memory = None
+        arena.stride = 1
+        arena.fingerprint = None
+        if path is not None:
+            arena.buffer = np.memmap(path, dtype=dtype, mode="r+", shape=tuple(shape))
+        else:
+            arena.memory = shared_memory.SharedMemory(name=name)
+            arena.buffer = np.ndarray(shape=tuple(shape), dtype=dtype, buffer=arena.memory.buf)
+        return arena
+
+    def save(self, path: str, fingerprint=None, stride=None):
+        # Bez kompresji zapis jest bezstratny - bufor trafia do pliku w swojej precyzji
+        with open(path, "wb") as target:
+            np.savez(target, trajectories=self.buffer, stride=np.array(self.stride if stride is None else stride),
+                     fingerprint=np.array(fingerprint or self.fingerprint or ""))
+
+    @classmethod
+    def load(cls, path: str):
+        arena = cls.__new__(cls)
+        arena.path = None
+        arena.memory = None
+        with np.load(path) as archive:
+            arena.buffer = archive["trajectories"]
+            arena.stride = int(archive["stride"])
+            arena.fingerprint = str(archive["fingerprint"]) or None
+        return arena
+
+    def detach(self):
+        # Widoki na bufor musza zniknac przed zamknieciem segmentu
+        if isinstance(self.buffer, np.memmap):
+            self.buffer.flush()
+            self.buffer = None
+        if self.memory is not None:
+            self.buffer = None
+            try:
+                self.memory.close()
+            except BufferError:
+                pass
+            self.memory = None
+
+    def release(self):
+        # Po unlink nazwa znika z systemu, ale zmapowany bufor zostaje wazny az do zamkniecia
+        if self.memory is not None:
+            self.memory.unlink()
+
+    def getName(self):
+        return None if self.memory is None else self.memory.name
+
+    def isShared(self):
+        return self.memory is not None
+
+    def truncate(self, samples: int):
+        self.buffer = self.buffer[:max(samples, 1)]
+
+    def getView(self, index: int):
+        return self.buffer[:, index]
+
+    def record(self, sample: int, positions, order=None):
+        if order is None:
+            self.buffer[sample] = positions
+        else:
+            self.buffer[sample, order] = positions
+
+    def clear(self, start: int, columns):
+        self.buffer[start:, columns] = np.nan
+
+    def getSample(self, sample: int):
+        return self.buffer[sample]
+
+    def getPath(self):
+        return self.path
+
+    def getBuffer(self):
+        return self.buffer
+
+    def countSamples(self):
+        return self.buffer.shape[0]
+
+    def countParticles(self):
+        return self.buffer.shape[1]
+
+    def getDimensions(self):
+        return self.buffer.shape[2]
+
+    def getStride(self):
+        return self.stride
+
+    def getFingerprint(self):
+        return self.fingerprint
+
+    def getSize(self):
+        return self.buffer.nbytes
+
+
+class CompressedArena:
+
+    def __init__(self, shape, chunk: int, lowers, scales, blocks, cache=2**26, stride=1, fingerprint=None):
+        self.shape = tuple(int(size) for size in shape)
+        self.chunk = chunk
+        self.stride = stride
+        self.fingerprint = fingerprint
+        self.lowers = lowers
+        self.scales = scales
+        self.blocks = blocks
+        self.cache = OrderedDict()
+        self.cachesize = cache
+        self.cached = 0
+
+    @staticmethod
+    def chooseChunk(count: int, dimensions: int):
+        # Okolo 2^20 wartosci na blok - dekodowany blok miesci sie w pamieci podrecznej odtwarzania
+        return int(np.clip(2**20 // max(count * dimensions, 1), 8, 256))
+
+    @classmethod
+    def encode(cls, buffer, chunk=None, level=6, stride=1):
+        samples, count, dimensions = buffer.shape
+        chunk = chunk or cls.chooseChunk(count, dimensions)
+        lowers, scales, blocks = [], [], []
+
+        for start in range(0, samples, chunk):
+            block = np.asarray(buffer[start:start + chunk], dtype=float)
+            finite = np.isfinite(block)
+            lower = np.min(np.where(finite, block, np.inf), axis=0)
+            upper = np.max(np.where(finite, block, -np.inf), axis=0)
+            empty = ~np.isfinite(lower)
+            lower[empty], upper[empty] = 0.0, 0.0
+            scale = (upper - lower) / LEVELS
+            scale[scale == 0] = 1.0
+
+            with np.errstate(invalid="ignore"):
+                quantized = np.where(finite, np.rint((block - lower) / scale), MISSING).astype(np.uint16)
+            deltas = quantized.copy()
+            deltas[1:] -= quantized[:-1]
+
+            # Starsze i mlodsze bajty osobno - male przyrosty daja dlugie serie zer w starszych bajtach
+            planes = np.stack((deltas & 0xFF, deltas >> 8)).astype(np.uint8)
+            blocks.append(zlib.compress(planes.tobytes(), level))
+            lowers.append(lower)
+            scales.append(scale)
+        return cls(buffer.shape, chunk, lowers, scales, blocks, stride=stride)
+
+    def decodeChunk(self, index: int):
+        if index in self.cache:
+            self.cache.move_to_end(index)
+            return self.cache[index]
+
+        rows = min(self.chunk, self.shape[0] - index * self.chunk)
+        planes = np.frombuffer(zlib.decompress(self.blocks[index]), dtype=np.uint8)
+        planes = planes.reshape((2, rows) + self.shape[1:])
+        deltas = planes[0].astype(np.uint16) | (planes[1].astype(np.uint16) << 8)
+        quantized = np.cumsum(deltas, axis=0, dtype=np.uint16)
+
+        values = self.lowers[index] + quantized * self.scales[index]
+        values[quantized == MISSING] = np.nan
+
+        # Limit w bajtach, a nie w blokach - przy malej liczbie czastek slad obejmuje wiele blokow
+        self.cache[index] = values
+        self.cached += values.nbytes
+        while self.cached > self.cachesize and len(self.cache) > 1:
+            self.cached -= self.cache.popitem(last=False)[1].nbytes
+        return values
+
+    def decode(self):
+        return np.concatenate([self.decodeChunk(index) for index in range(len(self.blocks))])
+
+    def gather(self, samples, column: int):
+        samples = np.asarray(samples, dtype=np.int64).reshape(-1)
+        points = np.empty(shape=(len(samples), self.shape[2]), dtype=float)
+        chunks = samples // self.chunk
+        for index in np.unique(chunks):
+            rows = np.flatnonzero(chunks == index)
+            points[rows] = self.decodeChunk(index)[samples[rows] - index * self.chunk, column]
+        return points
+
+    def save(self, path: str, fingerprint=None):
+        data = b"".join(self.blocks)
+        offsets = np.cumsum([0] + [len(block) for block in self.blocks])
+        fingerprint = self.fingerprint if fingerprint is None else fingerprint
+        with open(path, "wb") as target:
+            np.savez(target, shape=np.array(self.shape), chunk=np.array(self.chunk), lowers=np.array(self.lowers),
+                     scales=np.array(self.scales), offsets=offsets, data=np.frombuffer(data, dtype=np.uint8),
+                     stride=np.array(self.stride), fingerprint=np.array(fingerprint or ""))
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as archive:
+            data = archive["data"].tobytes()
+            offsets = archive["offsets"]
+            blocks = [data[offsets[index]:offsets[index + 1]] for index in range(len(offsets) - 1)]
+            # Pliki bez klucza stride zapisywaly kazdy krok
+            stride = int(archive["stride"]) if "stride" in archive.files else 1
+            fingerprint = str(archive["fingerprint"]) if "fingerprint" in archive.files else None
+            return cls(archive["shape"], int(archive["chunk"]), list(archive["lowers"]), list(archive["scales"]), blocks,
+                       stride=stride, fingerprint=fingerprint or None)
+
+    def getView(self, index: int):
+        return CompressedView(self, index)
+
+    def getSample(self, sample: int):
+        return self.decodeChunk(sample // self.chunk)[sample % self.chunk]
+
+    def countSamples(self):
+        return self.shape[0]
+
+    def countParticles(self):
+        return self.shape[1]
+
+    def getDimensions(self):
+        return self.shape[2]
+
+    def getStride(self):
+        return self.stride
+
+    def getFingerprint(self):
+        return self.fingerprint
+
+    def getSize(self):
+        return sum(len(block) for block in self.blocks) + sum(lower.nbytes + scale.nbytes for lower, scale
+                                                             in zip(self.lowers, self.scales))
+
+
+class CompressedView:
+
+    def __init__(self, arena, column: int):
+        self.arena = arena
+        self.column = column
+
+    def __len__(self):
+        return self.arena.countSamples()
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.arena.getSample(int(key))[self.column]
+        return self.arena.gather(np.arange(len(self))[key], self.column)
+
+    def __array__(self, dtype=None):
+        points = self.arena.gather(np.arange(len(self)), self.column)
+        return points if dtype is None else points.astype(dtype)
+
+    @property
+    def shape(self):
+        return len(self), self.arena.getDimensions()
@@ -1,4 +1,5 @@
 import numpy as np
+from time import perf_counter
 
 
 class Camera:
@@ -18,6 +19,16 @@ class Camera:
         moved = self.movePoint(scaled)
         return moved
 
+    def adjustViews(self, points):
+        points = np.asarray(points)
+        converted = np.empty(shape=(len(points), 2), dtype=float)
+        converted[:, 0] = points[:, 0]
+        converted[:, 1] = -points[:, 1]
+        converted += self.center[:2]
+        if self.scale != 1:
+            converted = converted*self.scale + (1-self.scale)*self.center[:2]
+        return converted + self.dR[:2] + self.offset[:2]
+
     def convertCoordinates(self, point):
         return np.array([point[0], -point[1], 0]).reshape((3,)) + self.center
 
@@ -86,3 +97,104 @@ class Camera:
         dR[0] *= -1
         offset[0] *= -1
         return list((dR + offset)/self.scale)
+
+
+class TrajectoryPyramid:
+
+    def __init__(self, trajectory, tolerance=1/16, depth=16):
+        self.tolerance = tolerance
+        self.levels = []
+
+        points = np.asarray(trajectory)[:, :2]
+        points = points[np.all(np.isfinite(points), axis=1)]
+        if not len(points):
+            self.levels.append(points)
+            return
+        for level in range(depth):
+            cell = self.tolerance * 2**level
+            cells = np.floor(points / cell)
+
+            keep = np.ones(shape=(len(points),), dtype=bool)
+            keep[1:] = np.any(cells[1:] != cells[:-1], axis=1)
+            keep[-1] = True
+            points = points[keep]
+
+            self.levels.append(points)
+            if len(points) <= 2:
+                break
+
+    def getLevel(self, scale):
+        pixel = 1/scale
+        level = int(np.floor(np.log2(pixel/self.tolerance))) if pixel > self.tolerance else 0
+        return self.levels[min(level, len(self.levels) - 1)]
+
+    def countLevels(self):
+        return len(self.levels)
+
+
+class PlaybackClock:
+
+    def __init__(self):
+        self.samples = 1
+        self.interval = 1.0
+        self.speed = 1.0
+        self.continuous = True
+
+        self.position = 0.0
+        self.anchor = None
+
+    def configure(self, samples, interval):
+        self.samples = max(1, int(samples))
+        self.interval = interval
+        self.seek(self.position)
+
+    def start(self):
+        if not self.continuous and self.position >= self.samples - 1:
+            self.position = 0.0
+        if self.anchor is None:
+            self.anchor = perf_counter()
+
+    def pause(self):
+        self.position = self.getPosition()
+        self.anchor = None
+
+    def isRunning(self):
+        return self.anchor is not None
+
+    def seek(self, position):
+        self.position = min(max(float(position), 0.0), float(self.samples - 1))
+        if self.anchor is not None:
+            self.anchor = perf_counter()
+
+    def getPosition(self):
+        if self.anchor is None:
+            return self.position
+
+        elapsed = perf_counter() - self.anchor
+        position = self.position + elapsed*self.speed/self.interval
+        last = self.samples - 1
+        if position <= last:
+            return position
+        if self.continuous and last > 0:
+            return position % last
+        self.position = float(last)
+        self.anchor = None
+        return self.position
+
+    def isFinished(self):
+        return not self.continuous and self.anchor is None and self.position >= self.samples - 1
+
+    def getSpeed(self):
+        return self.speed
+
+    def setSpeed(self, speed):
+        self.position = self.getPosition()
+        if self.anchor is not None:
+            self.anchor = perf_counter()
+        self.speed = min(max(speed, 1/64), 64)
+
+    def setContinuous(self, continuous):
+        self.position = self.getPosition()
+        if self.anchor is not None:
+            self.anchor = perf_counter()
+        self.continuous = continuous
@@ -1,4 +1,5 @@
 import os
+import numpy as np
 from PySide2.QtGui import QIcon, QFont
 
 from wmzf.base.sublcasses.widgets import *
@@ -100,37 +101,55 @@ class Menu(QWidget):
             self.runbutton.setDisabled(True)
 
 
-class ParticleList(QListWidget):
-
-    particleSelected = Signal(int)
-    particleUnselected = Signal()
-    toggleStationary = Signal(int)
+class ParticleListModel(QAbstractListModel):
 
     def __init__(self):
         super().__init__()
-
-        self.listfont = QFont()
-        self.listfont.setFamily("Arial")
-        self.listfont.setPixelSize(13)
-        self.setFont(self.listfont)
-        self.setIconSize(QSize(64, 64))
+        self.world = None
+        self.rows = None
+        self.count = 0
+        self.descriptions = None
+        self.filter = ""
+        self.sortkey = "index"
 
         self.proton = QIcon("resources/icons/proton.png")
         self.electron = QIcon("resources/icons/electron.png")
 
-        self.setStyleSheet("color: white;")
+    def setWorld(self, world):
+        self.world = world
+        self.descriptions = None
+        self.rearrange()
+
+    def rearrange(self):
+        self.beginResetModel()
+        self.rows = self.arrangeRows()
+        self.countRows()
+        self.endResetModel()
+
+    def countRows(self):
+        if self.world is None:
+            self.count = 0
+        elif self.rows is None:
+            self.count = self.world.countParticles()
+        else:
+            self.count = len(self.rows)
 
-    def addElement(self, particle):
-        item = QListWidgetItem()
-        values = self.createDescription(particle)
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.count
 
-        if particle.getCharge() < 0:
-            item.setIcon(self.electron)
-        else:
-            item.setIcon(self.proton)
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole and role != Qt.DecorationRole:
+            return None
+        row = self.sourceRow(index.row())
+        if row < 0:
+            return None
 
-        item.setText(values)
-        self.addItem(item)
+        particle = self.world.getParticle(row)
+        if role == Qt.DisplayRole:
+            return self.createDescription(particle)
+        return self.electron if particle.getCharge() < 0 else self.proton
 
     def createDescription(self, particle):
         values = 60 * "*" + "\n"
@@ -142,6 +161,132 @@ class ParticleList(QListWidget):
         values += 60 * "*"
         return values
 
+    def getDescriptions(self):
+        # Opisy do filtrowania budowane raz - kolejne znaki filtra przeszukuja gotowe napisy
+        particles = self.world.getParticles()
+        if self.descriptions is None or len(self.descriptions) != len(particles):
+            self.descriptions = [self.createDescription(particle).lower() for particle in particles]
+        return self.descriptions
+
+    def sourceRow(self, row):
+        if not 0 <= row < self.count:
+            return -1
+        if self.rows is None:
+            return row
+        return int(self.rows[row])
+
+    def viewRow(self, row):
+        if self.rows is None:
+            return row
+        matches = np.flatnonzero(self.rows == row)
+        return int(matches[0]) if len(matches) else -1
+
+    def arrangeRows(self):
+        if self.world is None or self.sortkey == "index" and not self.filter:
+            return None
+
+        particles = self.world.getParticles()
+        rows = np.arange(len(particles))
+        if self.filter:
+            needle = self.filter.lower()
+            rows = rows[[needle in description for description in self.getDescriptions()]]
+        if self.sortkey == "mass":
+            keys = np.array([particle.getMass() for particle in particles], dtype=float)
+            rows = rows[np.argsort(keys[rows], kind="stable")]
+        elif self.sortkey == "charge":
+            keys = np.array([particle.getCharge() for particle in particles], dtype=float)
+            rows = rows[np.argsort(keys[rows], kind="stable")]
+        return rows
+
+    def setFilter(self, text):
+        self.filter = text
+        self.rearrange()
+
+    def setSortKey(self, key):
+        self.sortkey = key.lower()
+        self.rearrange()
+
+    def particleInserted(self, row):
+        if self.rows is None:
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.countRows()
+            self.endInsertRows()
+            return
+
+        if self.descriptions is not None:
+            # Tylko nowy opis - pozostale sa juz w pamieci podrecznej
+            self.descriptions.insert(row, self.createDescription(self.world.getParticle(row)).lower())
+        rows = self.arrangeRows()
+        position = np.flatnonzero(rows == row)
+        if len(position):
+            self.beginInsertRows(QModelIndex(), int(position[0]), int(position[0]))
+            self.rows = rows
+            self.countRows()
+            self.endInsertRows()
+
+    def particleChanged(self, row):
+        if self.descriptions is not None:
+            self.descriptions[row] = self.createDescription(self.world.getParticle(row)).lower()
+        if self.rows is None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+        else:
+            self.rearrange()
+
+    def particleRemoved(self, row):
+        position = self.viewRow(row)
+        self.beginRemoveRows(QModelIndex(), position, position)
+        if self.descriptions is not None:
+            del self.descriptions[row]
+        if self.rows is not None:
+            self.rows = np.delete(self.rows, position)
+            self.rows[self.rows > row] -= 1
+        self.countRows()
+        self.endRemoveRows()
+
+
+class ParticleList(QListView):
+
+    particleSelected = Signal(int)
+    particleUnselected = Signal()
+    toggleStationary = Signal(int)
+
+    def __init__(self):
+        super().__init__()
+
+        self.listfont = QFont()
+        self.listfont.setFamily("Arial")
+        self.listfont.setPixelSize(13)
+        self.setFont(self.listfont)
+        self.setIconSize(QSize(64, 64))
+        self.setUniformItemSizes(True)
+
+        self.particles = ParticleListModel()
+        self.setModel(self.particles)
+
+        self.setStyleSheet("color: white;")
+
+    def setWorld(self, world):
+        self.particles.setWorld(world)
+
+    def getModel(self):
+        return self.particles
+
+    def setFilter(self, text):
+        self.particles.setFilter(text)
+
+    def setSortKey(self, key):
+        self.particles.setSortKey(key)
+
+    def currentRow(self):
+        index = self.currentIndex()
+        if not index.isValid():
+            return -1
+        return self.particles.sourceRow(index.row())
+
+    def setCurrentRow(self, row):
+        self.setCurrentIndex(self.particles.index(self.particles.viewRow(row)))
+
     def mousePressEvent(self, e):
         if e.button() == 1:
             super().mousePressEvent(e)
@@ -158,6 +303,7 @@ class ParticleList(QListWidget):
             self.particleSelected.emit(row)
 
     def currentChanged(self, current, previous):
+        super().currentChanged(current, previous)
         self.particleUnselected.emit()
 
 
@@ -324,6 +470,7 @@ class FieldForm(QWidget):
 class ParametersForm(QWidget):
 
     parametersChanged = Signal()
+    compressionChanged = Signal(bool)
 
     def __init__(self):
         super().__init__()
@@ -337,6 +484,11 @@ class ParametersForm(QWidget):
         self.precisionfield.setPlaceholderText("[seconds]")
         self.layout.addWidget(self.precisionfield)
 
+        # Kompresja kwantyzuje trajektorie do 16 bitow, wiec domyslnie jest wylaczona
+        self.compression = QCheckBox("Compress Trajectories")
+        self.compression.toggled.connect(self.compressionChanged.emit)
+        self.layout.addWidget(self.compression)
+
         self.setbutton = Button("SET")
         self.setbutton.clicked.connect(self.parametersChanged.emit)
         self.layout.addWidget(self.setbutton)
@@ -350,6 +502,14 @@ class ParametersForm(QWidget):
         self.timefield.setText(time)
         self.precisionfield.setText(precision)
 
+    def setCompression(self, compression):
+        self.compression.blockSignals(True)
+        self.compression.setChecked(compression)
+        self.compression.blockSignals(False)
+
+    def getCompression(self):
+        return self.compression.isChecked()
+
     def getTime(self):
         return self.timefield.getText()
 
@@ -385,6 +545,7 @@ class SimulationForm(QWidget):
         time = str(world.getTime())
         precision = str(world.getPrecision())
         self.parametersform.fillEntries(time, precision)
+        self.parametersform.setCompression(world.getCompression())
 
 
 class NewWorld(QWidget):
@@ -4,13 +4,14 @@ from PySide2.QtWidgets import *
 
 from wmzf.simulation import *
 
-from wmzf.base.widgets import Menu, ParticleList, ParticleForm, SimulationForm, NewWorld, LoadFileWidget, SaveFileWidget
+from wmzf.base.widgets import Menu, ParticleList, ParticleForm, SimulationForm, NewWorld, LoadFileWidget, SaveFileWidget, Entry
 from wmzf.base.simtools import ListParser
-from wmzf.base.viewtools import Camera
+from wmzf.base.viewtools import Camera, PlaybackClock
+from wmzf.base.profiling import FrameProfiler
+from wmzf.base.spatial import UniformGrid
+from wmzf.base.generators import uniformBox
 
 from time import perf_counter
-from random import randint
-from math import ceil
 
 
 class StyleLoader:
@@ -55,6 +56,8 @@ class SimulationStateTracker(QObject):
             progress = self.world.getProgress()
             active = self.world.isActive()
             finished = progress == 100
+            # Nieudany przebieg tez konczy obliczenia - inaczej menu zostaloby zablokowane
+            done = finished or self.world.isFailed() and not active
 
             if active and not finished:
                 self.progressed.emit()
@@ -66,10 +69,10 @@ class SimulationStateTracker(QObject):
             if not active and self.startedEmited:
                 self.startedEmited = False
 
-            if finished and not self.finishedEmited:
+            if done and not self.finishedEmited:
                 self.finished.emit(finished)
                 self.finishedEmited = True
-            if not finished and self.finishedEmited:
+            if not done and self.finishedEmited:
                 self.finishedEmited = False
 
             if valid != self.isvalid:
@@ -98,23 +101,41 @@ class SimulationView(QWidget):
 
         self.world = None
         self.step = 0
-        self.skip = 0
+        self.position = 0.0
+        self.clock = PlaybackClock()
         self.timer.timeout.connect(self.callPaintEvent)
         self.timer.setInterval(11)
         self.clockevent = False
+        self.profiler = FrameProfiler()
+        self.profiledirectory = "profiles"
 
         self.finished = False
 
         self.positive = QImage("resources/icons/proton.png")
         self.negative = QImage("resources/icons/electron.png")
+        self.icons = {}
+
+        self.splatsize = 12
+        self.splatlimit = 500
+        self.labellimit = 40
+        self.traillimit = 200
 
         self.followedParticle = -1
+        self.screenindex = None
+        self.screenids = np.zeros(shape=(0,), dtype=np.int64)
+        self.pickradius = 12
+        self.setMouseTracking(True)
 
         self.mincharge = 0
         self.maxcharge = 0
 
         self.continuous = True
 
+        self.timeline = QSlider(Qt.Horizontal, self)
+        self.timeline.setRange(0, 0)
+        self.timeline.sliderMoved.connect(self.seekSimulation)
+        self.timeline.hide()
+
         self.overlay = True
         self.data = True
         self.trails = True
@@ -134,9 +155,12 @@ class SimulationView(QWidget):
                 self.mincharge = self.maxcharge = 1
             else:
                 self.mincharge, self.maxcharge = self.world.getMinMaxCharge()
+            self.resetPlayback()
 
     def paintEvent(self, e):
         start = perf_counter()
+        if self.world is not None and not self.trajectories and self.clockevent:
+            self.advancePlayback()
         painter = QPainter(self)
 
         painter.setPen(QColor(0, 154, 26, 255))
@@ -147,13 +171,16 @@ class SimulationView(QWidget):
 
         if self.world is not None:
             if not self.trajectories:
-                self.drawParticles(painter)
+                with self.profiler.measure("particles"):
+                    self.drawParticles(painter)
                 if self.world.isActive():
                     self.drawProgress(painter)
                 if self.overlay:
-                    self.drawOverlay(painter)
+                    with self.profiler.measure("overlay"):
+                        self.drawOverlay(painter)
             else:
-                self.drawTrajectories(painter)
+                with self.profiler.measure("trajectories"):
+                    self.drawTrajectories(painter)
                 if not self.followedParticle < 0:
                     painter.drawText(30, 100, "ID: " + str(self.followedParticle))
 
@@ -161,84 +188,152 @@ class SimulationView(QWidget):
         painter.setPen(Qt.white)
         painter.drawLine(center[0], center[1] - 10, center[0], center[1] + 10)
         painter.drawLine(center[0] - 10, center[1], center[0] + 10, center[1])
-        painter.end()
         finish = perf_counter()
 
-        if self.world is not None and not self.trajectories and self.clockevent:
-            self.skip = ceil((0.007 + finish - start - 0.0005)/self.world.getPrecision())
-            if self.step + self.skip - 1 < self.world.getSteps():
-                self.step += self.skip - 1
-            else:
-                if self.continuous:
-                    self.step = 0
-                else:
-                    self.step = self.world.getSteps() - 1
-                    self.timer.stop()
+        self.profiler.finishFrame(start, finish)
+        if self.profiler.isEnabled():
+            self.drawProfile(painter)
+        painter.end()
+
+    def advancePlayback(self):
+        self.position = self.clock.getPosition()
+        self.step = int(self.position)
+        if self.clock.isFinished():
+            self.timer.stop()
+
+        self.timeline.blockSignals(True)
+        self.timeline.setValue(self.step)
+        self.timeline.blockSignals(False)
+
+    def resetPlayback(self):
+        self.clock.pause()
+        self.clock.configure(self.world.getRecordedSteps(), self.world.getSampleInterval())
+        self.clock.setContinuous(self.continuous)
+        self.clock.seek(0)
+        self.position = 0.0
+        self.step = 0
+
+        self.timeline.setRange(0, self.world.getRecordedSteps() - 1)
+        self.timeline.setValue(0)
 
     def drawParticles(self, painter):
+        particles = self.world.getParticles()
+        points = self.camera.adjustViews(self.world.getPositions(self.position))
+        center = self.camera.getCenter()[:2]
+
         if -1 < self.followedParticle < self.world.countParticles():
-            followed = self.world.getParticle(self.followedParticle)
-            target = followed.getPoint(self.step)
-            target = self.camera.adjustView(target)
+            target = points[self.followedParticle]
         else:
-            target = self.camera.getCenter()
-        points = []
+            target = center
+        points = points - target + center
+
+        visible = self.visibleMask(points, 13)
+        indices = np.flatnonzero(visible)
+        self.screenindex = UniformGrid(points[indices], 2*self.pickradius)
+        self.screenids = indices
+
+        if len(indices) > self.splatlimit:
+            cells = np.floor(points[indices]/self.splatsize).astype(np.int64) + 2
+            keys = cells[:, 0]*(self.height()//self.splatsize + 5) + cells[:, 1]
+            _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            crowded = counts[inverse] > 1
+            with self.profiler.measure("splats"):
+                self.drawSplats(painter, points[indices[crowded]], indices[crowded])
+            indices = indices[~crowded]
+
+        labels = self.data and len(indices) <= self.labellimit
+        trails = self.trails and self.followedParticle < 0 and len(indices) <= self.traillimit
+
+        for index in indices:
+            particle = particles[index]
+            point = points[index]
 
-        for particle in self.world.getParticles():
-            point = particle.getPoint(self.step)
-            point = self.camera.adjustView(point)
-
-            point = point - target + self.camera.getCenter()
             image, diameter = self.particleIcon(particle)
-            try:
-                painter.drawImage(point[0] - diameter/2, point[1] - diameter/2, image)
-            except OverflowError:
-                continue
-            if self.data:
-                painter.setFont(QFont("Arial", 7))
-                painter.setPen(Qt.white)
-                self.drawParticleDetails(painter, point, particle)
-            if self.autoscale:
-                points.append(point)
-            if self.trails and self.followedParticle < 0:
-                length = int(1/self.world.getPrecision())
-                painter.setPen(Qt.white)
-                if self.step > length:
-                    start = self.step - length
-                else:
-                    start = 0
-                for i in range(start, self.step, int(length/50)):
-                    coords = particle.getPoint(i)
-                    coords = self.camera.adjustView(coords)
-                    try:
-                        painter.drawPoint(coords[0], coords[1])
-                    except OverflowError:
-                        pass
+            painter.drawImage(point[0] - diameter/2, point[1] - diameter/2, image)
+            if labels:
+                with self.profiler.measure("labels"):
+                    painter.setFont(QFont("Arial", 7))
+                    painter.setPen(Qt.white)
+                    self.drawParticleDetails(painter, point, particle)
+            if trails:
+                with self.profiler.measure("trails"):
+                    self.drawTrail(painter, particle)
 
         if self.autoscale:
-            center = self.camera.getCenter()
-            if not all((0 < point[0] < 2*center[0] and 0 < point[1] < 2*center[1]) for point in points)\
-                    and any((0 < point[0] < 2*center[0] and 0 < point[1] < 2*center[1]) for point in points):
-                self.camera.changeScale(-1)
-            else:
-                if all((center[0]//2 < point[0] < 3*center[0]//2 and center[1]//2 < point[1] < 3*center[1]//2) for point in points) \
-                        and self.camera.getScale() < 4:
-                    self.camera.changeScale(1)
+            self.adjustScale(points[np.all(np.isfinite(points), axis=1)])
+
+    def visibleMask(self, points, margin=0):
+        return np.all(np.isfinite(points), axis=1) \
+               & (points[:, 0] > -margin) & (points[:, 0] < self.width() + margin) \
+               & (points[:, 1] > -margin) & (points[:, 1] < self.height() + margin)
+
+    def drawSplats(self, painter, points, indices):
+        width = self.width()//self.splatsize + 1
+        height = self.height()//self.splatsize + 1
+        cells = np.floor(points/self.splatsize).astype(np.int64)
+        cells[:, 0] = np.clip(cells[:, 0], 0, width - 1)
+        cells[:, 1] = np.clip(cells[:, 1], 0, height - 1)
+
+        charges = self.world.getCharges()[indices]
+        density = np.zeros(shape=(height, width), dtype=float)
+        polarity = np.zeros(shape=(height, width), dtype=float)
+        np.add.at(density, (cells[:, 1], cells[:, 0]), 1)
+        np.add.at(polarity, (cells[:, 1], cells[:, 0]), charges)
+
+        pixels = np.zeros(shape=(height, width, 4), dtype=np.uint8)
+        occupied = density > 0
+        pixels[..., 0] = np.where(polarity > 0, 220, 20)
+        pixels[..., 1] = 20
+        pixels[..., 2] = np.where(polarity > 0, 20, 220)
+        pixels[..., 3] = np.where(occupied, np.clip(60 + 40*np.log2(density + 1), 0, 255), 0)
+
+        image = QImage(pixels.tobytes(), width, height, 4*width, QImage.Format_RGBA8888)
+        painter.drawImage(QRectF(0, 0, width*self.splatsize, height*self.splatsize), image)
+
+    def drawTrail(self, painter, particle):
+        length = max(int(1/self.world.getSampleInterval()), 1)
+        start = max(0, self.step - length)
+        samples = np.arange(start, self.step, max(1, length//50))
+        if not len(samples):
+            return
+
+        points = self.camera.adjustViews(particle.getPoints(samples))
+        points = points[self.visibleMask(points)]
+        painter.setPen(Qt.white)
+        painter.drawPoints(QPolygonF([QPointF(x, y) for x, y in points]))
 
-    def particleIcon(self, particle):
-        if particle.getCharge() < 0:
-            icon = self.negative
+    def adjustScale(self, points):
+        if not len(points):
+            return
+        center = self.camera.getCenter()
+        inside = (0 < points[:, 0]) & (points[:, 0] < 2*center[0]) & (0 < points[:, 1]) & (points[:, 1] < 2*center[1])
+        if not np.all(inside) and np.any(inside):
+            self.camera.changeScale(-1)
         else:
-            icon = self.positive
-        diameter = int((10*abs(particle.getCharge())/self.maxcharge + 14)*self.camera.scale)
+            central = (center[0]//2 < points[:, 0]) & (points[:, 0] < 3*center[0]//2) \
+                      & (center[1]//2 < points[:, 1]) & (points[:, 1] < 3*center[1]//2)
+            if np.all(central) and self.camera.getScale() < 4:
+                self.camera.changeScale(1)
+
+    def particleIcon(self, particle):
+        negative = particle.getCharge() < 0
+        # Przy silach niezaleznych od ladunku wszystkie czastki moga byc obojetne
+        relative = abs(particle.getCharge())/self.maxcharge if self.maxcharge else 0.0
+        diameter = int((10*relative + 14)*self.camera.scale)
         if diameter < 5: diameter = 5
         if diameter > 26: diameter = 26
-        return icon.scaled(diameter, diameter), diameter
+
+        key = (negative, diameter)
+        if key not in self.icons:
+            icon = self.negative if negative else self.positive
+            self.icons[key] = icon.scaled(diameter, diameter)
+        return self.icons[key], diameter
 
     def drawTrajectories(self, painter):
+        self.screenindex = None
         painter.setPen(Qt.white)
         painter.setFont(QFont("Arial", 10))
-        increment = 5*int(0.007/self.world.getPrecision())
+        width, height = self.width(), self.height()
 
         if self.followedParticle < 0:
             particles = self.world.getParticles()
@@ -246,20 +341,15 @@ class SimulationView(QWidget):
             particles = [self.world.getParticle(self.followedParticle)]
 
         for particle in particles:
-            for i in range(0, self.world.getSteps(), increment):
-                try:
-                    coords = particle.getPoint(i)
-                    coords = self.camera.adjustView(coords)
-                    painter.drawPoint(coords[0], coords[1])
-                except OverflowError:
-                    continue
-                except ValueError:
-                    break
+            points = particle.getPyramid().getLevel(self.camera.getScale())
+            points = self.camera.adjustViews(points)
+            visible = (points[:, 0] >= 0) & (points[:, 0] < width) & (points[:, 1] >= 0) & (points[:, 1] < height)
+            painter.drawPoints(QPolygonF([QPointF(x, y) for x, y in points[visible]]))
 
     def drawOverlay(self, painter):
-        self.drawTable(painter, 30, 130, "SIMULATION", ["Physics time:", "Frame skip:", "Step:", "Continuous:"],
-                                                       [self.getSimulationTime, self.getSkip, self.getStep, self.getContinuous],
-                                                       [" s", "", "", ""])
+        self.drawTable(painter, 30, 130, "SIMULATION", ["Physics time:", "Speed:", "Step:", "Continuous:"],
+                                                       [self.getSimulationTime, self.clock.getSpeed, self.getStep, self.getContinuous],
+                                                       [" s", "x", "", ""])
 
         self.drawTable(painter, 30, 252, "CAMERA", ["Position:", "Scale:", "Auto-scaling:", "Following:", "Trails:"],
                                                    [self.camera.getCameraPosition, self.camera.getScale, self.autoscaling, self.isFollowing, self.getTrails],
@@ -282,6 +372,10 @@ class SimulationView(QWidget):
             self.drawParticleDetails(painter, np.array([1190, 200]), particle)
 
     def drawTable(self, painter, x, y, title, rows, data, units):
+        with self.profiler.measure("tables"):
+            self.drawTableRows(painter, x, y, title, rows, data, units)
+
+    def drawTableRows(self, painter, x, y, title, rows, data, units):
         painter.setPen(QColor(0, 154, 26, 255))
         painter.setFont(QFont("Arial", 14))
         painter.drawText(x, y, title)
@@ -294,11 +388,55 @@ class SimulationView(QWidget):
                 value = list(value)
             painter.drawText(x + 100, y + 20*i, str(value) + units[i-1])
 
+    def drawProfile(self, painter):
+        x, y = self.width() - 320, 110
+        painter.setPen(QColor(0, 154, 26, 255))
+        painter.setFont(QFont("Arial", 14))
+        painter.drawText(x, y, "PROFILER")
+
+        painter.setFont(QFont("Arial", 10))
+        paint = self.profiler.getStatistics(self.profiler.getPaintTimes())
+        interval = self.profiler.getStatistics(self.profiler.getIntervals())
+        rows = ["Paint: {:.1f} ms avg, {:.1f} p95, {:.1f} max".format(*paint),
+                "Interval: {:.1f} ms avg, {:.1f} p95, {:.1f} max".format(*interval)]
+        rows += ["  {}: {:.2f} ms".format(name, elapsed) for name, elapsed in self.profiler.getSections()]
+        directory = self.world.getProfiling() if self.world is not None else None
+        rows.append("Compute profile (F5): " + ("off" if directory is None else directory))
+        report = self.world.getMemoryReport() if self.world is not None else None
+        if report is not None:
+            peak = "n/a" if report["peak"] is None else "{:.0f} MB".format(report["peak"] / 2**20)
+            rows.append("Memory: {:.0f} MB est, {} peak".format(report["total"] / 2**20, peak))
+            parts = report["plan"].split(", ")
+            rows += ["  " + ", ".join(parts[:2]), "  " + ", ".join(parts[2:])]
+        for i, row in enumerate(rows):
+            painter.drawText(x, y + 20 + 16*i, row)
+
+        y += 40 + 16*len(rows)
+        edges = self.profiler.getEdges()
+        for title, samples in (("paint", self.profiler.getPaintTimes()), ("interval", self.profiler.getIntervals())):
+            self.drawHistogram(painter, x, y, title, self.profiler.getHistogram(samples), edges)
+            y += 90
+
+    def drawHistogram(self, painter, x, y, title, counts, edges):
+        width, height = 30, 50
+        painter.drawText(x, y, title + " [ms]")
+        scale = height / max(int(counts.max()), 1)
+        for i, value in enumerate(counts):
+            bar = int(value*scale)
+            painter.fillRect(x + i*(width + 4), y + 10 + height - bar, width, bar, QColor(0, 154, 26, 200))
+            painter.drawText(x + i*(width + 4), y + height + 24, str(int(edges[i])) + "+")
+
     def drawProgress(self, painter):
         painter.setFont(QFont("Arial", 14))
         painter.setPen(QColor(0, 154, 26, 255))
         center = self.camera.getCenter()
-        painter.drawText(center[0] - 30, center[1]*2 - 30, "Calculating... " + str(self.world.getProgress()) + " %")
+        if self.world.isCancelled():
+            status = "Cancelling... "
+        elif self.world.isPaused():
+            status = "Paused (Space to resume, Esc to cancel) "
+        else:
+            status = "Calculating... "
+        painter.drawText(center[0] - 30, center[1]*2 - 30, status + str(self.world.getProgress()) + " %")
 
     def drawParticleDetails(self, painter, position, particle):
         x = position[0] + 20
@@ -323,20 +461,16 @@ class SimulationView(QWidget):
         return self.step
 
     def getSimulationTime(self):
-        return round(self.step*self.world.getPrecision(), 2)
-
-    def getSkip(self):
-        return self.skip
-
-    def updateSkip(self):
-        if self.world is not None:
-            pass
+        return round(self.position*self.world.getSampleInterval(), 2)
 
     def getFinished(self):
         return self.finished
 
     def setFinished(self, finished):
         self.finished = finished
+        if self.world is not None and finished:
+            self.resetPlayback()
+        self.timeline.setVisible(finished)
         self.repaint()
 
     def getContinuous(self):
@@ -354,22 +488,39 @@ class SimulationView(QWidget):
     def setWindowSize(self, size):
         self.camera.updateCenter(size.width(), size.height())
 
+    def resizeEvent(self, e):
+        self.timeline.setGeometry(30, self.height() - 40, self.width() - 60, 20)
+
     #funkcje sterujące animacją
     def startSimulation(self):
         if self.world is not None and self.finished:
+            self.clock.start()
             self.timer.start()
             self.setFocus()
 
     def pauseSimulation(self):
+        self.clock.pause()
         self.timer.stop()
         self.setFocus()
 
     def restartSimulation(self):
+        self.clock.pause()
+        self.clock.seek(0)
+        self.position = 0.0
         self.step = 0
         self.timer.stop()
+        self.timeline.setValue(0)
         self.repaint()
         self.setFocus()
 
+    def seekSimulation(self, step):
+        if self.world is not None and self.finished:
+            self.clock.seek(step)
+            self.position = self.clock.getPosition()
+            self.step = int(self.position)
+            if not self.timer.isActive():
+                self.repaint()
+
     def mousePressEvent(self, e):
         if self.world is not None and not self.autoscale:
             pos = np.array([e.pos().x(), e.pos().y(), 0], dtype=float).reshape((3,))
@@ -380,13 +531,37 @@ class SimulationView(QWidget):
                 self.repaint()
 
     def mouseMoveEvent(self, e):
-        if self.world is not None and self.followedParticle < 0 and not self.autoscale:
+        if self.world is not None and self.followedParticle < 0 and not self.autoscale and self.camera.isMoving():
             pos = np.array([e.pos().x(), e.pos().y(), 0], dtype=float).reshape((3,))
-            if self.camera.isMoving():
-                self.camera.setEndPoint(pos)
+            self.camera.setEndPoint(pos)
 
             if not self.timer.isActive():
                 self.repaint()
+        elif self.world is not None:
+            self.showParticleTooltip(e)
+
+    def mouseDoubleClickEvent(self, e):
+        if self.world is not None and e.button() == 1 and self.screenindex is not None:
+            self.followedParticle = self.pickParticle(e.pos())
+            self.repaint()
+
+    def pickParticle(self, pos):
+        if self.screenindex is None:
+            return -1
+        nearest = self.screenindex.nearest([pos.x(), pos.y()], self.pickradius)
+        if nearest < 0:
+            return -1
+        return int(self.screenids[nearest])
+
+    def showParticleTooltip(self, e):
+        index = self.pickParticle(e.pos())
+        if index < 0 or index >= self.world.countParticles():
+            QToolTip.hideText()
+            return
+        particle = self.world.getParticle(index)
+        coords = particle.getPoint(self.step)
+        QToolTip.showText(e.globalPos(), "ID: {}\nM: {:.2e} kg\nC: {:.2e} C\nP: [{}, {}] px".format(
+            index, particle.getMass(), particle.getCharge(), int(coords[0]), int(coords[1])), self)
 
     def mouseReleaseEvent(self, e):
         if self.world is not None and self.followedParticle < 0 and not self.autoscale:
@@ -411,6 +586,21 @@ class SimulationView(QWidget):
         if e.key() == Qt.Key_F3:
             self.overlay = not self.overlay
             self.repaint()
+        if e.key() == Qt.Key_F4:
+            self.profiler.setEnabled(not self.profiler.isEnabled())
+            self.repaint()
+        if e.key() == Qt.Key_F5 and self.world is not None:
+            self.world.setProfiling(None if self.world.getProfiling() is not None else self.profiledirectory)
+            self.repaint()
+        if self.world is not None and self.world.isActive():
+            if e.key() == Qt.Key_Escape:
+                self.world.cancel()
+            if e.key() == Qt.Key_Space:
+                if self.world.isPaused():
+                    self.world.resume()
+                else:
+                    self.world.pause()
+            self.repaint()
         if self.world is not None and self.world.countParticles() > 0:
             if e.key() == 16777236:
                 self.followedParticle += 1
@@ -431,6 +621,11 @@ class SimulationView(QWidget):
                 self.trails = not self.trails
             if e.key() == Qt.Key_C:
                 self.continuous = not self.continuous
+                self.clock.setContinuous(self.continuous)
+            if e.key() in (Qt.Key_Plus, Qt.Key_Equal):
+                self.clock.setSpeed(2*self.clock.getSpeed())
+            if e.key() == Qt.Key_Minus:
+                self.clock.setSpeed(self.clock.getSpeed()/2)
             self.repaint()
 
 
@@ -459,6 +654,21 @@ class SettingsView(QWidget):
         self.particlelist.particleUnselected.connect(self.clearForm)
         self.particlelist.toggleStationary.connect(self.toggleStationary)
 
+        self.particlefilter = Entry()
+        self.particlefilter.setPlaceholderText("filter")
+        self.particlefilter.textChanged.connect(self.particlelist.setFilter)
+
+        self.particlesort = QComboBox()
+        self.particlesort.addItems(["Index", "Mass", "Charge"])
+        self.particlesort.currentTextChanged.connect(self.particlelist.setSortKey)
+
+        self.listcontrols = QWidget()
+        self.listcontrols.setLayout(QHBoxLayout())
+        self.listcontrols.layout().setContentsMargins(0, 0, 0, 0)
+        self.listcontrols.layout().addWidget(self.particlefilter, 2)
+        self.listcontrols.layout().addWidget(self.particlesort, 1)
+
+        self.leftlayout.addWidget(self.listcontrols)
         self.leftlayout.addWidget(self.particlelist)
         self.leftpanel.setLayout(self.leftlayout)
 
@@ -479,6 +689,7 @@ class SettingsView(QWidget):
 
         self.paramsform = self.simulationform.getParametersForm()
         self.paramsform.parametersChanged.connect(self.updateSimulationParameters)
+        self.paramsform.compressionChanged.connect(self.updateCompression)
 
         self.fieldsform = self.simulationform.getFieldForm()
         self.fieldsform.fieldsChanged.connect(self.updateElectromagneticField)
@@ -522,6 +733,10 @@ class SettingsView(QWidget):
         except ValueError:
             self.paramsform.fillEntries(str(self.world.getTime()), str(self.world.getPrecision()))
 
+    def updateCompression(self, compression):
+        if self.world is not None:
+            self.world.setCompression(compression)
+
     def updateElectromagneticField(self):
         try:
             parser = ListParser(self.fieldsform.getElectric())
@@ -574,11 +789,10 @@ class SettingsView(QWidget):
 
     def setWorld(self, world):
         self.world = world
+        self.particlelist.setWorld(world)
 
     def fillList(self):
-        self.particlelist.clear()
-        for particle in self.world.getParticles():
-            self.particlelist.addElement(particle)
+        self.particlelist.setWorld(self.world)
 
     def fillForm(self, index):
         particle = self.world.getParticle(index)
@@ -605,25 +819,31 @@ class SettingsView(QWidget):
                 self.particleform.setRemove()
                 self.fillForm(row)
         else:
+            model = self.particlelist.getModel()
             if origin == "add":
                 try:
                     self.world.addParticle(params)
                 except ValueError:
                     pass
-                self.fillList()
+                else:
+                    model.particleInserted(self.world.countParticles() - 1)
                 self.clearForm()
             else:
                 row = self.particlelist.currentRow()
-                self.world.editParticle(params, row)
-                self.fillList()
+                try:
+                    self.world.editParticle(params, row)
+                except (ValueError, TypeError):
+                    self.fillForm(row)
+                else:
+                    model.particleChanged(row)
             self.worldChanged.emit()
 
     def removeParticle(self):
         row = self.particlelist.currentRow()
-        particle = self.world.getParticle(row)
-        self.world.removeParticle(particle)
+        if row >= 0:
+            self.world.removeParticle(self.world.getParticle(row))
+            self.particlelist.getModel().particleRemoved(row)
         self.clearForm()
-        self.fillList()
         self.worldChanged.emit()
 
     def cancelInput(self):
@@ -647,10 +867,7 @@ class SettingsView(QWidget):
             stationary = particle.is_stationary()
             particle.is_stationary(not stationary)
 
-            listitem = self.particlelist.item(row)
-            description = listitem.text()
-            description = description.replace(str(stationary), str(particle.is_stationary()))
-            listitem.setText(description)
+            self.particlelist.getModel().particleChanged(row)
             self.worldChanged.emit()
 
     def fillParameters(self):
@@ -760,9 +977,8 @@ class SimulationWindow(QMainWindow):
         self.stateTracker.setWorld(self.world)
 
     def editWorld(self):
-        if self.world.getProgress() == 100:
+        if self.world.getProgress() == 100 or self.world.isFailed():
             self.stateTracker.reset()
-            self.simview.updateSkip()
             self.menu.disableControls()
 
             self.world = self.world.reset()
@@ -772,7 +988,13 @@ class SimulationWindow(QMainWindow):
 
     def simulate(self):
         if self.world is not None:
-            self.world.beginCalculations()
+            # Ciezkie obliczenia nie moga zaglodzic timera widoku, wiec ida do osobnego procesu
+            self.world.setProcessMode(True)
+            try:
+                self.world.beginCalculations()
+            except MemoryError as error:
+                self.reportError("Not enough memory", str(error))
+                return
             self.simview.setFocus()
             self.menu.disable()
 
@@ -782,6 +1004,11 @@ class SimulationWindow(QMainWindow):
 
         self.menu.disable(False)
         self.menu.runbutton.setDisabled(True)
+        if self.world.isFailed():
+            self.reportError("Simulation failed", self.world.getFailure())
+
+    def reportError(self, title, message):
+        QMessageBox.warning(self, title, message)
 
     def saveWorld(self, path):
         try:
@@ -812,11 +1039,10 @@ class SimulationWindow(QMainWindow):
 
     def randomWorld(self, time, precision, n):
         self.world = Simulation(time, precision)
-        for i in range(n):
-            self.world.addParticle([randint(1, 100), randint(-100, 100)/3400,
-                                            [randint(-500, 500), randint(-500, 500), 0],
-                                            [randint(-100, 100), randint(-100, 100), 0],
-                                            not not randint(0, 1), self.world.getSteps()])
+        rng = np.random.default_rng()
+        charges = rng.integers(1, 101, n) * rng.choice((-1, 1), n) / 3400
+        self.world.addParticles(rng.integers(1, 101, n), charges, uniformBox(n, 1000, seed=rng),
+                                uniformBox(n, 200, seed=rng))
         self.settings.setWorld(self.world)
         self.simview.setWorld(self.world)
 
@@ -0,0 +1,282 @@
+import json
+import asyncio
+import argparse
+from time import monotonic
+from itertools import count
+from urllib.parse import urlsplit, parse_qs
+
+from wmzf.simulation import Simulation
+
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class SimulationJob:
+
+    def __init__(self, identifier: int, world):
+        self.identifier = identifier
+        self.world = world
+        self.state = "queued"
+        self.error = None
+        self.submitted = monotonic()
+        self.finished = None
+
+    def finish(self, state: str, error=None):
+        self.state = state
+        self.error = error
+        self.finished = monotonic()
+
+    def isFinished(self):
+        return self.finished is not None
+
+    def countFrames(self):
+        if self.world is None or self.world.arena is None:
+            return 0
+        if self.isFinished():
+            return self.world.getRecordedSteps() if self.state != "failed" else self.world.getCompletedSamples()
+        return self.world.getCompletedSamples()
+
+    def getFrame(self, step: int):
+        world = self.world
+        positions = world.getSample(step)[:, :world.getDimensions()]
+        return {"step": step, "time": step * world.getSampleInterval(), "positions": positions.tolist()}
+
+    def getStatus(self):
+        world = self.world
+        return {"id": self.identifier, "state": self.state, "error": self.error,
+                "progress": world.getProgress() if world is not None else 0,
+                "steps": world.getSteps() if world is not None else 0, "frames": self.countFrames(),
+                "particles": world.countParticles() if world is not None else 0,
+                "events": len(world.getEvents()) if world is not None else 0}
+
+
+class SimulationService:
+
+    def __init__(self, host="127.0.0.1", port=8642, path=None, workers=2, queuesize=8, retention=600.0, keep=32,
+                 stride=10, maxscene=64 * 2**20, separate=True, poll=0.1):
+        if workers < 1 or queuesize < 1:
+            raise ValueError("Service needs at least one worker and one queue slot.")
+        self.host = host
+        self.port = port
+        self.path = path
+        self.concurrency = workers
+        self.queuesize = queuesize
+        self.retention = retention
+        self.keep = keep
+        self.stride = stride
+        self.maxscene = maxscene
+        self.separate = separate
+        self.poll = poll
+
+        self.jobs = {}
+        self.identifiers = count(1)
+        self.queue = None
+        self.workers = []
+
+    async def serve(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.queuesize)
+        self.workers = [asyncio.create_task(self.work()) for worker in range(self.concurrency)]
+        if self.path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, self.path)
+        else:
+            self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for job in self.jobs.values():
+            if job.world is not None and job.state == "running":
+                job.world.cancel()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    async def work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.state == "queued":
+                    await self.runJob(job)
+            except Exception as error:
+                job.finish("failed", str(error))
+            finally:
+                self.queue.task_done()
+                self.purge()
+
+    async def runJob(self, job):
+        world = job.world
+        if not world.validate():
+            job.finish("failed", "Scene has nothing to simulate.")
+            return
+
+        job.state = "running"
+        world.setProcessMode(self.separate)
+        world.beginCalculations()
+        while world.is_alive():
+            await asyncio.sleep(self.poll)
+
+        if world.getProgress() != 100:
+            job.finish("failed", world.getFailure() or "Compute process failed.")
+        else:
+            job.finish("cancelled" if world.isCancelled() else "done")
+
+    def purge(self):
+        # Zakonczone zadania trzymamy przez okres retencji i najwyzej keep najnowszych
+        now = monotonic()
+        finished = sorted((job for job in self.jobs.values() if job.isFinished()), key=lambda job: job.finished)
+        expired = [job for job in finished if now - job.finished > self.retention]
+        expired += [job for job in finished[:max(len(finished) - self.keep, 0)] if job not in expired]
+        for job in expired:
+            job.world = None
+            del self.jobs[job.identifier]
+
+    def parseScene(self, text: str):
+        world = Simulation(1, 0.1)
+        world.loads(text)
+        return world
+
+    async def submit(self, body):
+        if self.queue.full():
+            return 503, {"error": "Job queue is full, try again later."}
+        try:
+            text = body.decode("utf-8")
+            world = await asyncio.get_running_loop().run_in_executor(None, self.parseScene, text)
+        except (UnicodeDecodeError, AttributeError, TypeError, ValueError, IndexError) as error:
+            return 400, {"error": "Invalid scene: " + str(error)}
+
+        job = SimulationJob(next(self.identifiers), world)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return 503, {"error": "Job queue is full, try again later."}
+        self.jobs[job.identifier] = job
+        return 202, job.getStatus()
+
+    def cancel(self, job):
+        if job.state == "queued":
+            job.finish("cancelled")
+        elif job.state == "running":
+            job.world.cancel()
+        else:
+            return 409, job.getStatus()
+        return 200, job.getStatus()
+
+    async def handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).decode("latin-1").split()
+            if len(request) != 3:
+                raise ValueError("Malformed request line.")
+            method, target, version = request
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, separator, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+
+            length = int(headers.get("content-length", 0))
+            if length > self.maxscene:
+                await self.respond(writer, 413, {"error": "Scene exceeds " + str(self.maxscene) + " bytes."})
+                return
+            body = await reader.readexactly(length) if length > 0 else b""
+            await self.dispatch(method, target, body, writer)
+        except (ValueError, asyncio.IncompleteReadError) as error:
+            await self.respond(writer, 400, {"error": str(error)})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, body, writer):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split("/") if part]
+        if not parts or parts[0] != "jobs":
+            await self.respond(writer, 404, {"error": "Unknown resource."})
+            return
+
+        if len(parts) == 1:
+            if method == "POST":
+                await self.respond(writer, *(await self.submit(body)))
+            elif method == "GET":
+                self.purge()
+                await self.respond(writer, 200, [job.getStatus() for job in self.jobs.values()])
+            else:
+                await self.respond(writer, 405, {"error": "Use GET or POST."})
+            return
+
+        job = self.jobs.get(int(parts[1])) if parts[1].isdigit() else None
+        if job is None:
+            await self.respond(writer, 404, {"error": "No such job."})
+        elif len(parts) == 2 and method == "GET":
+            await self.respond(writer, 200, job.getStatus())
+        elif len(parts) == 2 and method == "DELETE":
+            await self.respond(writer, *self.cancel(job))
+        elif len(parts) == 3 and parts[2] == "frames" and method == "GET":
+            stride = int(query.get("stride", [self.stride])[0])
+            start = int(query.get("start", [0])[0])
+            if stride < 1 or start < 0:
+                raise ValueError("Stride must be positive and start non-negative.")
+            await self.streamFrames(job, writer, start, stride)
+        else:
+            await self.respond(writer, 405 if len(parts) <= 3 else 404, {"error": "Unsupported request."})
+
+    async def respond(self, writer, status, payload):
+        content = json.dumps(payload).encode("utf-8")
+        head = "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: close\r\n"
+        head = head.format(status, REASONS.get(status, ""), len(content))
+        if status == 503:
+            head += "Retry-After: 5\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + content)
+        await writer.drain()
+
+    async def streamFrames(self, job, writer, start, stride):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n"
+                     b"Connection: close\r\n\r\n")
+        # Klatki czytane sa wprost z areny w miare postepu - wolny klient spowalnia tylko swoj strumien
+        step = start
+        while job.world is not None:
+            available = job.countFrames()
+            while step < available and job.world is not None:
+                await self.writeChunk(writer, json.dumps(job.getFrame(step)) + "\n")
+                step += stride
+            if job.isFinished() and step >= job.countFrames():
+                break
+            await asyncio.sleep(self.poll)
+        await self.writeChunk(writer, json.dumps({"state": job.state, "error": job.error}) + "\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def writeChunk(self, writer, text):
+        data = text.encode("utf-8")
+        writer.write(("%x\r\n" % len(data)).encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local simulation job service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8642)
+    parser.add_argument("--socket", default=None, help="serve on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=2, help="simulations running at the same time")
+    parser.add_argument("--queue", type=int, default=8, help="queued jobs before new ones are refused")
+    parser.add_argument("--retention", type=float, default=600.0, help="seconds finished jobs are kept")
+    parser.add_argument("--keep", type=int, default=32, help="finished jobs kept at most")
+    parser.add_argument("--stride", type=int, default=10, help="default frame decimation")
+    arguments = parser.parse_args()
+
+    service = SimulationService(arguments.host, arguments.port, arguments.socket, arguments.workers, arguments.queue,
+                                arguments.retention, arguments.keep, arguments.stride)
+    asyncio.run(service.serve())
+
+
+if __name__ == "__main__":
+    main()
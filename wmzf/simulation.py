@@ -1,13 +1,32 @@
 import gc
+import os
+import hashlib
+import datetime
+import tracemalloc
 import numpy as np
+from time import sleep
+from tempfile import mkstemp
 from threading import Thread
+from multiprocessing import get_context
 
 from wmzf.base.simtools import SimulationSaver, SimulationLoader, SimulationParser
+from wmzf.base.viewtools import TrajectoryPyramid
+from wmzf.base.storage import TrajectoryArena, CompressedArena, loadArena
+from wmzf.base.registry import ParticleRegistry
+from wmzf.base.engines import ParticleState, selectEngine
+from wmzf.base.forces import ForceLaw, CoulombForce, createForce
+from wmzf.base.collisions import CollisionHandler
+from wmzf.base.domains import PipeTransport, bisect, slabs, assign, runDomain, RUNNING, PAUSED, CANCELLED
+from wmzf.base.spatial import mortonOrder
+from wmzf.base.kernels import COULOMB, SOFTENING
+from wmzf.base.fields import ExternalField
+from wmzf.base.profiling import profileCall
+from wmzf.base.planner import MemoryPlanner
 
 # noinspection PyTypeChecker
 class Particle:
 
-    def __init__(self, mass, charge, r0, v0, s, steps):
+    def __init__(self, mass, charge, r0, v0, s, checked=False):
 
         self.mass = mass
         self.charge = charge
@@ -15,21 +34,14 @@ class Particle:
         self.r0 = np.array(r0, dtype=float)
         self.v0 = np.array(v0, dtype=float)
         self.stationary = s
-        self.steps = steps
 
         self.coefficient = self.charge/self.mass
+        self.trajectory = None
+        self.pyramid = None
 
-        if not self.stationary:
-            self.r = np.array(self.r0)
-            self.v = np.array(self.v0)
-            self.a = np.zeros(shape=(3,), dtype=float)
-
-            self.trajectory = np.zeros(shape=(self.steps, 3), dtype=float)
-            self.trajectory[0] = np.array(self.r0)
-        else:
-            self.r = self.r0
-            self.trajectory = self.r0.reshape((1, 3))
-        self.check()
+        if not checked:
+            self.check()
+        self.reset()
 
     def __eq__(self, other):
         return other.mass == self.mass and other.charge == self.charge and other.stationary == self.stationary \
@@ -52,46 +64,34 @@ class Particle:
         self.setInitialPosition(self.r0)
         self.setInitialVelocity(self.v0)
         self.is_stationary(self.stationary)
-        self.setSteps(self.steps)
 
     def reset(self):
-        if not self.stationary:
-            self.r = np.array(self.r0)
-            self.v = np.array(self.v0)
-            self.a = np.zeros(shape=(3,), dtype=float)
-
-            self.trajectory = np.zeros(shape=(self.steps, 3), dtype=float)
-            self.trajectory[0] = np.array(self.r0)
-        else:
-            self.r = self.r0
-            self.trajectory = self.r0.reshape((1, 3))
-
-    def updateAcceleration(self, world, interactions):
-        superposition = np.zeros(shape=(3,), dtype=float)
-        for particle in world.getParticles():
-            if interactions and particle is not self:
-                superposition += particle.getField(self.r)
-            superposition += world.getElectric().getVector()
-            superposition += np.cross(self.v, world.getMagnetic().getVector())
-        self.a = self.coefficient * superposition
-
-    def updateVelocity(self, dt):
-        self.v += self.a * dt / 2.0
+        self.coefficient = self.charge/self.mass
+        self.r = np.array(self.r0)
+        self.v = np.array(self.v0)
+        self.a = np.zeros(shape=(3,), dtype=float)
 
-    def updatePosition(self, dt, step):
-        self.r += self.v * dt
-        self.updateTrajectory(step)
+        self.trajectory = None
+        self.pyramid = None
 
-    def updateTrajectory(self, step):
-        self.trajectory[step] = self.r
+    def bindTrajectory(self, trajectory):
+        self.trajectory = trajectory
+        self.pyramid = None
 
     def getPoint(self, index: int):
-        return self.trajectory[index * int(not self.stationary)]
+        if self.trajectory is None:
+            return self.r0
+        return self.trajectory[index]
+
+    def getPoints(self, indices):
+        if self.trajectory is None:
+            return np.broadcast_to(self.r0, (len(indices), 3))
+        return self.trajectory[np.asarray(indices)]
 
     def getField(self, r):
         delta = r - self.r
         distance = np.linalg.norm(delta)
-        return 8.9875 * 10e9 * self.charge * delta / (distance ** 3 + 10e-6)
+        return COULOMB * self.charge * delta / (distance ** 3 + SOFTENING)
 
     def getMass(self):
         return self.mass
@@ -110,8 +110,6 @@ class Particle:
     def setCharge(self, charge):
         if not isinstance(charge, (float, int)):
             raise TypeError("Charge must be a number.")
-        elif charge == 0:
-            raise ValueError("Charge must be non-zero.")
         else:
             self.charge = charge
 
@@ -125,7 +123,6 @@ class Particle:
             raise TypeError("Initial position vector must contain numbers.")
         else:
             self.r0 = np.array(position).astype(float)
-            self.trajectory[0] = self.r0
 
     def getInitialVelocity(self):
         return self.v0
@@ -139,8 +136,18 @@ class Particle:
             self.v0 = np.array(velocity).astype(float)
 
     def getTrajectory(self):
+        if self.trajectory is None:
+            return self.r0.reshape((1, 3))
         return self.trajectory
 
+    def buildPyramid(self, trajectory=None):
+        self.pyramid = TrajectoryPyramid(self.getTrajectory() if trajectory is None else trajectory)
+
+    def getPyramid(self):
+        if self.pyramid is None:
+            self.buildPyramid()
+        return self.pyramid
+
     def is_stationary(self, stationary=None):
         if stationary is None:
             return self.stationary
@@ -150,15 +157,6 @@ class Particle:
             else:
                 self.stationary = stationary
 
-    def setSteps(self, steps):
-        self.steps = steps
-        if not self.stationary:
-            self.trajectory = np.zeros(shape=(self.steps, 3), dtype=float)
-            self.trajectory[0] = np.array(self.r0)
-        else:
-            self.r = self.r0
-            self.trajectory = self.r0.reshape((1, 3))
-
     def is_overlapping(self, other):
         return all(v for v in other.r0 == self.r0)
 
@@ -212,18 +210,52 @@ class Simulation(Thread):
 
         self.steps = int(round(self.time / self.dt))
 
-        self.particles = []
+        self.registry = ParticleRegistry()
         self.kinetic = []
         self.static = []
 
+        self.arena = None
+        self.layout = None
+        self.dimensions = 3
+        self.engine = None
+        self.activeengine = None
+        self.force = CoulombForce()
+        self.collisions = None
+        self.events = []
+        self.domains = None
+        self.reorderinterval = 64
+        self.reorderthreshold = 4096
+        self.separateprocess = False
+        self.compression = False
+        self.maptolerance = None
+        self.meshtolerance = None
+        self.dtype = np.dtype(np.float64)
+        self.profiling = None
+        self.profiles = []
+        self.counter = None
+        self.command = RUNNING
+        self.control = None
+        self.completed = 0
+        self.recorded = None
+        self.stride = 1
+        self.storage = "memory"
+        self.pyramids = True
+        self.planner = MemoryPlanner()
+        self.requested = None
+        self.memoryreport = None
+        self.failure = None
+
         self.electricfield = Field(0, 0, 0, "e")
         self.magneticfield = Field(0, 0, 0, "m")
+        self.externalfields = []
 
         self.interactions = True
         self.progress = 0
 
     def __str__(self):
-        return "SIMULATION T:" + str(self.time) + " P:" + str(self.dt) + " I:" + str(int(self.interactions))
+        return "SIMULATION T:" + str(self.time) + " P:" + str(self.dt) + " I:" + str(int(self.interactions)) + \
+               " D:" + str(8 * self.dtype.itemsize) + " C:" + str(int(self.compression)) + \
+               " M:" + str(self.maptolerance or 0) + " G:" + str(self.meshtolerance or 0)
 
     def check(self, time, precision):
         if not all(isinstance(v, (float, int)) for v in (time, precision)):
@@ -234,58 +266,440 @@ class Simulation(Thread):
             raise ValueError("Seriously?")
 
     def validate(self):
-        noParticles = not len(self.particles)
-        oneParticle = len(self.particles) == 1
-        allStationary = all(particle.is_stationary() for particle in self.particles)
-        noFields = self.electricfield.is_zero() and self.magneticfield.is_zero()
+        noParticles = not len(self.registry)
+        oneParticle = len(self.registry) == 1
+        allStationary = all(particle.is_stationary() for particle in self.registry)
+        noFields = self.electricfield.is_zero() and self.magneticfield.is_zero() and not self.externalfields
 
         return not (noParticles or oneParticle and noFields or allStationary)
 
     def beginCalculations(self):
+        if self.validate():
+            self.planMemory()
+            self.allocateTrajectories()
         self.start()
 
+    def planMemory(self):
+        # Plan zastepuje ustawienia tylko na czas przebiegu - reset wraca do tego, o co prosil uzytkownik
+        if self.requested is None:
+            self.requested = (self.dtype, self.stride, self.storage)
+        plan, estimate = self.planner.plan(self)
+        self.dtype, self.stride, self.storage, self.pyramids = plan.dtype, plan.stride, plan.storage, plan.pyramids
+        self.memoryreport = {"plan": str(plan), "budget": self.planner.getBudget(), "estimate": estimate,
+                             "total": self.planner.total(estimate), "peak": None}
+        return plan
+
+    def allocateTrajectories(self, arena=None):
+        self.kinetic = [particle for particle in self.particles if not particle.is_stationary()]
+        self.static = [particle for particle in self.particles if particle.is_stationary()]
+
+        self.dimensions = 2 if self.isPlanar() else 3
+        if arena is not None:
+            self.arena = arena
+        elif self.domains is not None or self.storage == "memmap":
+            descriptor, path = mkstemp(prefix="wmzf-", suffix=".trajectory")
+            os.close(descriptor)
+            self.arena = TrajectoryArena(self.countSamples(), len(self.kinetic), self.dimensions, self.dtype, path=path)
+        else:
+            self.arena = TrajectoryArena(self.countSamples(), len(self.kinetic), self.dimensions, self.dtype,
+                                         shared=self.separateprocess)
+        self.bindTrajectories()
+
+        rows, initial = self.layout
+        self.arena.record(0, initial[rows, :self.dimensions])
+
+    def bindTrajectories(self):
+        for particle in self.particles:
+            particle.reset()
+        for index, particle in enumerate(self.kinetic):
+            particle.bindTrajectory(self.arena.getView(index))
+
+        rows = np.array([index for index, particle in enumerate(self.particles) if not particle.is_stationary()], dtype=np.int64)
+        initial = np.array([particle.getInitialPosition() for particle in self.particles], dtype=float).reshape((-1, 3))
+        self.layout = (rows, initial)
+
+    def isPlanar(self):
+        count = len(self.registry)
+        positions = np.fromiter((particle.getInitialPosition()[2] for particle in self.registry), dtype=float, count=count)
+        velocities = np.fromiter((particle.getInitialVelocity()[2] for particle in self.registry), dtype=float, count=count)
+
+        planarParticles = not np.any(positions) and not np.any(velocities)
+        planarFields = not self.electricfield.getVector()[2] and not np.any(self.magneticfield.getVector()[:2])
+        return planarParticles and planarFields and all(field.isPlanar() for field in self.externalfields)
+
     def run(self):
-        if self.validate():
-            self.kinetic = [particle for particle in self.particles if not particle.is_stationary()]
-            self.static = [particle for particle in self.particles if particle.is_stationary()]
-
-            for iteration in range(self.steps):
-                for particle in self.kinetic:
-                    particle.updateVelocity(self.dt)
-                    particle.updatePosition(self.dt, iteration)
-                for particle in self.kinetic:
-                    particle.updateAcceleration(self, self.interactions)
-                    particle.updateVelocity(self.dt)
-                self.progress = int(round(100 * iteration / self.steps))
+        if self.validate() and self.arena is not None:
+            self.completed = 0
+            path = self.arena.getPath()
+            # tracemalloc spowalnia petle o kilkadziesiat procent, wiec szczyt mierzymy tylko na zyczenie
+            tracing = self.planner.isTracing() and self.domains is None and not self.separateprocess
+            started = tracing and not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            elif tracing:
+                tracemalloc.reset_peak()
+            self.failure = None
+            try:
+                if self.domains is not None:
+                    self.runDomains()
+                elif self.separateprocess:
+                    self.runProcess()
+                else:
+                    self.integrateProfiled()
+
+                # Przerwany przebieg zostaje odtwarzalny do ostatniego zapisanego kroku
+                if self.completed < self.steps:
+                    self.truncateTrajectories(self.countSamples(self.completed))
+                if self.compression:
+                    self.compressTrajectories()
+                elif self.pyramids:
+                    for particle in self.kinetic:
+                        particle.buildPyramid()
+                if tracing:
+                    self.reportPeak(tracemalloc.get_traced_memory()[1])
+            except Exception as error:
+                self.failure = str(error)
+                raise
+            finally:
+                if started:
+                    tracemalloc.stop()
+                # Zmapowany plik pozostaje dostepny po usunieciu nazwy az do zamkniecia mapowania
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+            self.progress = 100
+
+    def reportPeak(self, peak):
+        if self.memoryreport is not None and peak is not None:
+            self.memoryreport["peak"] = peak
+
+    def integrateProfiled(self):
+        path = self.createProfilePath()
+        if path is None:
+            self.integrate()
+        else:
+            profileCall(path + ".prof", self.integrate)
+            self.profiles.append(path + ".prof")
+
+    def createProfilePath(self, label="compute"):
+        if self.profiling is None:
+            return None
+        os.makedirs(self.profiling, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S-%f")
+        return os.path.join(os.path.abspath(self.profiling), "wmzf-" + stamp + "-" + label)
+
+    def integrate(self):
+        state = ParticleState(self.kinetic, self.static, self.dimensions, self.force, self.dtype)
+        reordering = self.reorderinterval > 0 and state.countKinetic() >= self.reorderthreshold
+        if reordering:
+            state.sortSources()
+
+        engine = self.engine if self.engine is not None else selectEngine(self.force, len(self.registry),
+                                                                          maptolerance=self.maptolerance,
+                                                                          meshtolerance=self.meshtolerance)
+        engine.prepare(state, self)
+        self.activeengine = engine
+        self.events = []
+
+        for iteration in range(self.steps):
+            if not self.awaitStep():
+                break
+            if reordering and iteration % self.reorderinterval == 0:
+                self.reorderState(state)
+
+            state.velocities += state.accelerations * self.dt / 2.0
+            state.positions += state.velocities * self.dt
+            if self.collisions is not None:
+                self.resolveCollisions(state, iteration)
+            if iteration % self.stride == 0:
+                self.arena.record(iteration // self.stride, state.positions, state.order)
+
+            state.time = (iteration + 1) * self.dt
+            state.accelerations = engine.acceleration(state, self)
+            state.velocities += state.accelerations * self.dt / 2.0
+            self.reportProgress(iteration)
+
+    def awaitStep(self):
+        while self.getCommand() == PAUSED:
+            sleep(0.05)
+        return self.getCommand() != CANCELLED
+
+    def reportProgress(self, iteration):
+        self.progress = min(99, int(round(100 * iteration / self.steps)))
+        self.completed = iteration + 1
+        if self.counter is not None:
+            self.counter.value = iteration + 1
+
+    def runProcess(self):
+        context = get_context("spawn")
+        counter = context.Value("l", 0)
+        self.control = context.Value("i", self.command)
+        results = context.SimpleQueue()
+        profile = self.createProfilePath("process")
+        settings = {"externalfields": self.externalfields, "engine": self.engine, "collisions": self.collisions,
+                    "reorder": (self.reorderinterval, self.reorderthreshold), "stride": self.stride,
+                    "tracing": self.planner.isTracing(), "profile": None if profile is None else profile + ".prof"}
+
+        # Obliczenia poza procesem GUI - trajektorie trafiaja wprost do wspolnej pamieci
+        process = context.Process(target=computeScene, daemon=True,
+                                  args=(SimulationSaver.serialize(self), settings, self.arena.getName(),
+                                        self.arena.getBuffer().shape, self.arena.getPath(), counter, self.control,
+                                        results))
+        events = None
+        try:
+            # Start moze sie nie udac (np. silnik, ktorego nie da sie zserializowac) - segment i tak musi zniknac
+            process.start()
+            while events is None and process.is_alive():
+                if not results.empty():
+                    events = results.get()
+                self.completed = counter.value
+                self.progress = min(99, int(round(100 * self.completed / self.steps)))
+                sleep(0.05)
+            if events is None and not results.empty():
+                events = results.get()
+            process.join()
+        finally:
+            self.arena.release()
+            self.completed = counter.value
+            self.control = None
+        if profile is not None and os.path.isfile(profile + ".prof"):
+            self.profiles.append(profile + ".prof")
+
+        if process.exitcode != 0 or events is None:
+            raise RuntimeError("Compute process failed - trajectories are incomplete.")
+        self.events, peak = events
+        self.reportPeak(peak)
+
+    def runDomains(self):
+        count = self.domains["count"]
+        context = get_context("spawn")
+        state = ParticleState(self.kinetic, self.static, self.dimensions, self.force, self.dtype)
+
+        points = np.concatenate((state.positions, state.sources))
+        split = slabs if self.domains["method"] == "slabs" else bisect
+        tree = split(points, np.ones(shape=(len(points),), dtype=float), range(count))
+        kinetic, static = assign(tree, state.positions), assign(tree, state.sources)
+
+        setup = {"electric": self.electricfield, "magnetic": self.magneticfield, "externalfields": self.externalfields,
+                 "force": self.force, "interactions": self.interactions, "steps": self.steps, "dt": self.dt,
+                 "dimensions": self.dimensions, "theta": self.domains["theta"], "method": self.domains["method"],
+                 "rebalance": self.domains["rebalance"], "engine": self.engine, "maptolerance": self.maptolerance,
+                 "meshtolerance": self.meshtolerance, "dtype": self.dtype,
+                 "stride": self.stride, "profile": self.createProfilePath("domain")}
+        path, shape = self.arena.getPath(), self.arena.getBuffer().shape
+
+        transports = self.domains["transport"].create(count, context)
+        progress = context.Value("l", 0)
+        self.control = context.Value("i", self.command)
+        processes = []
+        for rank in range(count):
+            owned, sources = kinetic == rank, static == rank
+            part = {"columns": np.flatnonzero(owned), "positions": state.positions[owned],
+                    "velocities": state.velocities[owned], "masses": state.masses[owned], "charges": state.charges[owned],
+                    "sources": state.sources[sources], "sourcemasses": state.sourcemasses[sources],
+                    "sourcecharges": state.sourcecharges[sources]}
+            process = context.Process(target=runDomain, daemon=True,
+                                      args=(transports[rank], setup, part, path, shape, progress if rank == 0 else None,
+                                            self.control))
+            process.start()
+            processes.append(process)
+        for transport in transports:
+            transport.close()
+
+        # Jedna padnieta domena blokuje pozostale, wiec konczymy wszystkie
+        while any(process.is_alive() for process in processes):
+            if any(process.exitcode not in (None, 0) for process in processes):
+                for process in processes:
+                    process.terminate()
+                break
+            self.completed = progress.value
+            self.progress = min(99, int(round(100 * self.completed / self.steps)))
+            sleep(0.05)
+        for process in processes:
+            process.join()
+        self.completed = progress.value
+        self.control = None
+        if setup["profile"] is not None:
+            ranks = [setup["profile"] + "-rank" + str(rank) + ".prof" for rank in range(count)]
+            self.profiles.extend(path for path in ranks if os.path.isfile(path))
+
+        if any(process.exitcode != 0 for process in processes):
+            raise RuntimeError("Domain worker failed - trajectories are incomplete.")
+
+    def compressTrajectories(self):
+        # Piramidy powstaja jeszcze z pelnej precyzji, potem surowy bufor jest zwalniany
+        previous = self.arena
+        buffer = previous.getBuffer()
+        self.arena = CompressedArena.encode(buffer, stride=self.stride)
+        for index, particle in enumerate(self.kinetic):
+            particle.bindTrajectory(self.arena.getView(index))
+            if self.pyramids:
+                particle.buildPyramid(buffer[:, index])
+        del buffer
+        previous.detach()
+
+    def createFingerprint(self, stride):
+        # Plik trajektorii pasuje tylko do sceny, z ktorej powstal - liczba czastek i krokow to za malo.
+        # Skrot z odczytanych wartosci, a nie z tekstu, bo zapis liczb po wczytaniu bywa inny (2 i 2.0)
+        loader = SimulationLoader.loads(SimulationSaver.serialize(self))
+        scene = hashlib.sha256(repr((loader.getElements(), loader.getData())).encode()).hexdigest()
+        return "{} {} {} {}".format(self.countParticles(), self.steps, stride, scene)
+
+    def saveTrajectories(self, path):
+        if self.arena is None or self.progress != 100:
+            # Stary plik obok sceny wczytalby sie przy nastepnym otwarciu jako jej wynik
+            if os.path.isfile(path):
+                os.remove(path)
+            return False
+        fingerprint = self.createFingerprint(self.stride)
+        if isinstance(self.arena, CompressedArena):
+            self.arena.save(path, fingerprint)
+        elif self.compression:
+            CompressedArena.encode(self.arena.getBuffer(), stride=self.stride).save(path, fingerprint)
+        else:
+            self.arena.save(path, fingerprint, self.stride)
+        return True
+
+    def loadTrajectories(self, path):
+        arena = loadArena(path)
+        self.kinetic = [particle for particle in self.particles if not particle.is_stationary()]
+        self.static = [particle for particle in self.particles if particle.is_stationary()]
+        if arena.countParticles() != len(self.kinetic) or arena.getFingerprint() != self.createFingerprint(arena.getStride()):
+            print("[ERROR] Trajectory file does not match the scene", path)
+            return False
+
+        self.arena = arena
+        self.dimensions = arena.getDimensions()
+        self.stride = arena.getStride()
+        self.bindTrajectories()
+        decoded = arena.decode() if isinstance(arena, CompressedArena) else arena.getBuffer()
+        for index, particle in enumerate(self.kinetic):
+            particle.buildPyramid(decoded[:, index])
+        self.recorded = arena.countSamples()
+        self.completed = min(self.steps, self.recorded * self.stride)
+        self.progress = 100
+        return True
+
+    def truncateTrajectories(self, samples):
+        self.arena.truncate(samples)
+        self.recorded = self.arena.countSamples()
+        for index, particle in enumerate(self.kinetic):
+            particle.bindTrajectory(self.arena.getView(index))
+
+    def resolveCollisions(self, state, iteration):
+        events, survivors = self.collisions.handle(state, iteration)
+        self.events.extend(events)
+        if survivors is None:
+            return
+
+        alive, absorbed = survivors
+        if len(alive) < state.countKinetic():
+            # Pochloniete czastki znikaja ze stanu, a w arenie od tego kroku maja NaN
+            dead = np.setdiff1d(np.arange(state.countKinetic()), alive)
+            self.arena.clear(self.countSamples(iteration), state.getColumns()[dead])
+            state.reorder(alive)
+            self.activeengine.reorder(state, alive)
+        if absorbed:
+            self.activeengine.prepare(state, self)
+
+    def reorderState(self, state):
+        # Kolejnosc Mortona tylko wewnatrz silnika - arena zapisuje w kolejnosci uzytkownika
+        permutation = mortonOrder(state.positions)
+        state.reorder(permutation)
+        self.activeengine.reorder(state, permutation)
+
+    @property
+    def particles(self):
+        return self.registry.getParticles()
 
     def addParticle(self, params):
-        newparticle = Particle(params[0], params[1], params[2], params[3], False, self.steps)
-        if any(newparticle == particle for particle in self.particles):
+        newparticle = Particle(params[0], params[1], params[2], params[3], False)
+        self.force.checkCharges((newparticle.getCharge(),))
+        if self.registry.findDuplicate(newparticle) is not None:
             raise ValueError("This particle already exists!")
-        elif any(particle.is_overlapping(newparticle) for particle in self.particles) and self.interactions:
+        elif self.registry.isOccupied(newparticle.getInitialPosition()) and self.interactions:
             raise ValueError("This particle is overlapping with another!")
         else:
-            self.particles.append(newparticle)
+            self.registry.add(newparticle)
             if newparticle.is_stationary():
                 self.static.append(newparticle)
             else:
                 self.kinetic.append(newparticle)
         self.validate()
 
+    def addParticles(self, masses, charges, positions, velocities, stationary=None):
+        masses = np.asarray(masses, dtype=float).reshape(-1)
+        count = len(masses)
+        charges = np.broadcast_to(np.asarray(charges, dtype=float), (count,))
+        positions = self.padVectors(positions, count, "position")
+        velocities = self.padVectors(velocities, count, "velocity")
+        if stationary is None:
+            stationary = np.zeros(shape=(count,), dtype=bool)
+        stationary = np.broadcast_to(np.asarray(stationary, dtype=bool), (count,))
+
+        if not all(np.all(np.isfinite(values)) for values in (masses, charges, positions, velocities)):
+            raise TypeError("Particle parameters must be finite numbers.")
+        if np.any(masses <= 0):
+            raise ValueError("Mass must be positive. (At least we think so at the moment!)")
+        self.force.checkCharges(charges)
+
+        order = np.lexsort(positions.T[::-1])
+        coincident = np.all(positions[order[1:]] == positions[order[:-1]], axis=1)
+        if np.any(coincident):
+            first, second = order[:-1][coincident], order[1:][coincident]
+            duplicate = (masses[first] == masses[second]) & (charges[first] == charges[second]) \
+                        & (stationary[first] == stationary[second]) & np.all(velocities[first] == velocities[second], axis=1)
+            if np.any(duplicate):
+                raise ValueError("This particle already exists!")
+            if self.interactions:
+                raise ValueError("This particle is overlapping with another!")
+
+        keys = list(map(tuple, positions.tolist()))
+        for index, key in enumerate(keys):
+            if self.registry.isOccupiedKey(key):
+                newparticle = Particle(masses[index], charges[index], positions[index], velocities[index], bool(stationary[index]), True)
+                if self.registry.findDuplicate(newparticle) is not None:
+                    raise ValueError("This particle already exists!")
+                if self.interactions:
+                    raise ValueError("This particle is overlapping with another!")
+
+        newparticles = [Particle(mass, charge, position, velocity, flag, True) for mass, charge, position, velocity, flag
+                        in zip(masses.tolist(), charges.tolist(), positions, velocities, stationary.tolist())]
+        self.registry.extend(newparticles, keys)
+        for newparticle in newparticles:
+            if newparticle.is_stationary():
+                self.static.append(newparticle)
+            else:
+                self.kinetic.append(newparticle)
+        self.validate()
+
+    def padVectors(self, vectors, count, name):
+        vectors = np.asarray(vectors, dtype=float)
+        if vectors.ndim != 2 or len(vectors) != count or vectors.shape[1] not in (2, 3):
+            raise TypeError("Initial " + name + " vectors must be Nx2 or Nx3.")
+        padded = np.zeros(shape=(count, 3), dtype=float)
+        padded[:, :vectors.shape[1]] = vectors
+        return padded
+
     def editParticle(self, params, index):
+        # Edycja tworzy nowa czastke - bledne dane nie zostawiaja w rejestrze polowicznie zmienionej
         particle = self.particles[index]
-        particle.setMass(params[0])
-        particle.setCharge(params[1])
-        particle.setInitialPosition(params[2])
-        particle.setInitialVelocity(params[3])
+        replacement = Particle(params[0], params[1], params[2], params[3], particle.is_stationary())
+        self.force.checkCharges((replacement.getCharge(),))
+        occupants = [occupant for occupant in self.registry.findOccupants(replacement.getInitialPosition())
+                     if occupant is not particle]
+        if any(occupant == replacement for occupant in occupants):
+            raise ValueError("This particle already exists!")
+        elif occupants and self.interactions:
+            raise ValueError("This particle is overlapping with another!")
+        self.replaceParticle(replacement, index)
 
     def replaceParticle(self, replacement, index):
-        self.particles[index] = replacement
+        self.registry.replace(index, replacement)
         self.validate()
 
     def removeParticle(self, remove: Particle):
-        if remove in self.particles:
-            self.particles.remove(remove)
+        if remove in self.registry:
+            self.registry.remove(remove)
         elif remove in self.kinetic:
             self.kinetic.remove(remove)
         elif remove in self.static:
@@ -295,12 +709,12 @@ class Simulation(Thread):
         self.validate()
 
     def clearWorld(self):
-        del self.particles
+        del self.registry
         del self.kinetic
         del self.static
         gc.collect()
 
-        self.particles = []
+        self.registry = ParticleRegistry()
         self.kinetic = []
         self.static = []
         self.validate()
@@ -313,6 +727,19 @@ class Simulation(Thread):
 
         newWorld.setElectric(electric[0], electric[1])
         newWorld.setMagnetic(magnetic[2])
+        newWorld.setForce(self.force)
+        newWorld.collisions = self.collisions
+        newWorld.domains = self.domains
+        newWorld.separateprocess = self.separateprocess
+        newWorld.compression = self.compression
+        newWorld.maptolerance = self.maptolerance
+        newWorld.meshtolerance = self.meshtolerance
+        newWorld.dtype, newWorld.stride, newWorld.storage = self.requested or (self.dtype, self.stride, self.storage)
+        newWorld.planner = self.planner
+        newWorld.profiling = self.profiling
+        newWorld.setEngine(self.engine)
+        for field in self.externalfields:
+            newWorld.addExternalField(field)
 
         for particle in self.particles:
             simparser = SimulationParser(str(particle))
@@ -330,21 +757,48 @@ class Simulation(Thread):
     def load(self, name="", path="."):
         self.clearWorld()
         simloader = SimulationLoader(name, path)
-        data = simloader.load()
+        simloader.load()
+        self.loadElements(simloader)
 
-        self.setTime(data[0][0])
-        self.setPrecision(data[0][1])
-        self.interacting(not not data[0][2])
+        companion = os.path.splitext(simloader.getSource())[0] + ".trajectory"
+        if os.path.isfile(companion):
+            self.loadTrajectories(companion)
 
-        self.setElectric(data[1][0][0], data[1][0][1])
-        self.setMagnetic(data[1][1][2])
+    def loads(self, text: str):
+        self.clearWorld()
+        self.loadElements(SimulationLoader.loads(text))
+
+    def loadElements(self, simloader):
+        data = simloader.getData()
+        self.force = CoulombForce()
+        for element, parameters in zip(simloader.getElements(), data):
+            if element == "SIMULATION":
+                self.setTime(parameters[0])
+                self.setPrecision(parameters[1])
+                self.interacting(not not parameters[2])
+                # Pliki bez klucza D pochodza sprzed wyboru precyzji i liczone byly w float64
+                width = parameters[3] if len(parameters) > 3 else 64
+                if width not in (32, 64):
+                    raise ValueError("[ERROR] Unsupported data type width.")
+                self.setDataType(np.float32 if width == 32 else np.float64)
+                self.setCompression(len(parameters) > 4 and not not parameters[4])
+                # Zero oznacza dokladne sumowanie pola zrodel statycznych
+                tolerance = parameters[5] if len(parameters) > 5 else 0
+                self.setFieldMapTolerance(tolerance if tolerance > 0 else None)
+                tolerance = parameters[6] if len(parameters) > 6 else 0
+                self.setMeshTolerance(tolerance if tolerance > 0 else None)
+            elif element == "FIELD":
+                self.setElectric(parameters[0][0], parameters[0][1])
+                self.setMagnetic(parameters[1][2])
+            elif element == "FORCE":
+                cutoff = parameters[1] if parameters[1] > 0 else None
+                self.setForce(createForce(parameters[0], cutoff, parameters[2]))
+            elif element == "PARTICLE":
+                newparticle = Particle(parameters[0], parameters[1], parameters[2], parameters[3], not not parameters[4])
+                self.force.checkCharges((newparticle.getCharge(),))
+                self.registry.add(newparticle)
 
         self.steps = int(round(self.time / self.dt))
-
-        for i in range(2, len(data), 1):
-            parameters = data[i]
-            newparticle = Particle(parameters[0], parameters[1], parameters[2], parameters[3], not not parameters[4], self.steps)
-            self.particles.append(newparticle)
         self.validate()
 
     def getParticle(self, index):
@@ -353,6 +807,34 @@ class Simulation(Thread):
     def getParticles(self):
         return self.particles
 
+    def getPositions(self, step):
+        if not len(self.particles):
+            return np.zeros(shape=(0, 3), dtype=float)
+
+        lower = int(np.floor(step))
+        upper = min(lower + 1, self.getRecordedSteps() - 1)
+        weight = step - lower
+        positions = self.getSample(lower)
+        if weight > 0 and upper > lower:
+            positions += weight*(self.getSample(upper) - positions)
+        return positions
+
+    def getSample(self, step):
+        if self.layout is not None and len(self.layout[1]) == len(self.particles):
+            rows, initial = self.layout
+            positions = np.array(initial)
+            positions[rows, :self.dimensions] = self.arena.getSample(step)
+            return positions
+
+        positions = np.array([particle.getInitialPosition() for particle in self.particles], dtype=float)
+        for index, particle in enumerate(self.particles):
+            point = particle.getPoint(step)
+            positions[index, :len(point)] = point
+        return positions
+
+    def getCharges(self):
+        return np.fromiter((particle.getCharge() for particle in self.particles), dtype=float, count=len(self.particles))
+
     def getKinetic(self):
         return self.kinetic
 
@@ -368,11 +850,16 @@ class Simulation(Thread):
             return None
 
     def countParticles(self):
-        return len(self.particles)
+        return len(self.registry)
 
     def getParticleIndex(self, particle):
-        if particle in self.particles:
-            return self.particles.index(particle)
+        return self.registry.getIndex(particle)
+
+    def getParticleId(self, particle):
+        return self.registry.getIdentifier(particle)
+
+    def getParticleById(self, identifier):
+        return self.registry.getById(identifier)
 
     def setElectric(self, x: float, y: float):
         if not all(isinstance(v, (float, int)) for v in (x, y)):
@@ -394,6 +881,23 @@ class Simulation(Thread):
     def getMagnetic(self):
         return self.magneticfield
 
+    def addExternalField(self, field):
+        if not isinstance(field, ExternalField):
+            raise TypeError("External field must be an ExternalField instance.")
+        self.externalfields.append(field)
+        self.validate()
+
+    def removeExternalField(self, field):
+        self.externalfields.remove(field)
+        self.validate()
+
+    def clearExternalFields(self):
+        self.externalfields = []
+        self.validate()
+
+    def getExternalFields(self):
+        return self.externalfields
+
     def interacting(self, interactions=None):
         if interactions is None:
             return self.interactions
@@ -405,8 +909,6 @@ class Simulation(Thread):
 
     def updateSteps(self):
         self.steps = int(round(self.time / self.dt))
-        for particle in self.particles:
-            particle.setSteps(self.steps)
 
     def setTime(self, time: float):
         if not isinstance(time, (float, int)):
@@ -428,17 +930,236 @@ class Simulation(Thread):
     def getPrecision(self):
         return self.dt
 
+    def getDimensions(self):
+        return self.dimensions
+
+    def setReorderInterval(self, interval: int, threshold=None):
+        if not isinstance(interval, int) or interval < 0:
+            raise ValueError("Reorder interval must be a non-negative integer.")
+        self.reorderinterval = interval
+        if threshold is not None:
+            self.reorderthreshold = threshold
+
+    def getReorderInterval(self):
+        return self.reorderinterval
+
+    def getEngine(self):
+        return self.engine
+
+    def setEngine(self, engine):
+        self.engine = engine
+
+    def getActiveEngine(self):
+        return self.activeengine
+
+    def setCollisions(self, mode=None, radius=None):
+        if mode is None:
+            self.collisions = None
+        elif self.domains is not None:
+            raise ValueError("Collisions are not supported with domain decomposition.")
+        else:
+            self.collisions = CollisionHandler(radius, mode)
+
+    def setDomains(self, count=None, method="orb", rebalance=50, theta=0.5, transport=PipeTransport):
+        if count is None or count < 2:
+            self.domains = None
+        elif method not in ("orb", "slabs"):
+            raise ValueError("Domain split must be either 'orb' or 'slabs'.")
+        elif self.collisions is not None:
+            raise ValueError("Collisions are not supported with domain decomposition.")
+        else:
+            self.domains = {"count": int(count), "method": method, "rebalance": rebalance, "theta": theta,
+                            "transport": transport}
+
+    def getDomains(self):
+        return self.domains
+
+    def setProcessMode(self, separate: bool):
+        if not isinstance(separate, bool):
+            raise ValueError("'Separate process' flag must be a boolean.")
+        self.separateprocess = separate
+
+    def inProcessMode(self):
+        return self.separateprocess
+
+    def setCompression(self, compression: bool):
+        if not isinstance(compression, bool):
+            raise ValueError("'Compression' flag must be a boolean.")
+        self.compression = compression
+
+    def getCompression(self):
+        return self.compression
+
+    def setFieldMapTolerance(self, tolerance=None):
+        if tolerance is not None and (not isinstance(tolerance, (float, int)) or not tolerance > 0):
+            raise ValueError("Static field map tolerance must be positive.")
+        self.maptolerance = tolerance
+
+    def getFieldMapTolerance(self):
+        return self.maptolerance
+
+    def setMeshTolerance(self, tolerance=None):
+        if tolerance is not None and (not isinstance(tolerance, (float, int)) or not tolerance > 0):
+            raise ValueError("Particle-mesh tolerance must be positive.")
+        self.meshtolerance = tolerance
+
+    def getMeshTolerance(self):
+        return self.meshtolerance
+
+    def setDataType(self, dtype):
+        dtype = np.dtype(dtype)
+        if dtype not in (np.float32, np.float64):
+            raise ValueError("Data type must be either float32 or float64.")
+        self.dtype = dtype
+        self.requested = None
+
+    def getDataType(self):
+        return self.dtype
+
+    def setProfiling(self, directory=None):
+        self.profiling = directory
+
+    def getProfiling(self):
+        return self.profiling
+
+    def getProfiles(self):
+        return self.profiles
+
+    def setStride(self, stride: int):
+        if not isinstance(stride, int) or stride < 1:
+            raise ValueError("Output stride must be a positive integer.")
+        self.stride = stride
+        self.requested = None
+
+    def getStride(self):
+        return self.stride
+
+    def setStorage(self, storage: str):
+        if storage not in ("memory", "memmap"):
+            raise ValueError("Storage must be either 'memory' or 'memmap'.")
+        self.storage = storage
+        self.requested = None
+
+    def getStorage(self):
+        return self.storage
+
+    def setMemoryBudget(self, budget=None, fraction=0.5, automatic=True, tracing=False):
+        if budget is not None and budget <= 0:
+            raise ValueError("Memory budget must be positive.")
+        self.planner = MemoryPlanner(budget, fraction, automatic, tracing)
+
+    def getMemoryPlanner(self):
+        return self.planner
+
+    def getMemoryReport(self):
+        return self.memoryreport
+
+    def isCompressed(self):
+        return isinstance(self.arena, CompressedArena)
+
+    def getCollisions(self):
+        return self.collisions
+
+    def getEvents(self):
+        return self.events
+
+    def getForce(self):
+        return self.force
+
+    def setForce(self, force):
+        if not isinstance(force, ForceLaw):
+            raise TypeError("Force must be a ForceLaw instance.")
+        force.checkCharges(self.getCharges())
+        self.force = force
+
+    def getSampleInterval(self):
+        return self.dt*self.stride
+
     def getPrecisionMilliseconds(self):
         return self.dt*1000
 
     def getSteps(self):
         return self.steps
 
+    def getCompletedSteps(self):
+        return self.completed
+
+    def getRecordedSteps(self):
+        return self.countSamples() if self.recorded is None else self.recorded
+
+    def countSamples(self, steps=None):
+        steps = self.steps if steps is None else steps
+        return -(-steps // self.stride)
+
+    def getCompletedSamples(self):
+        return self.countSamples(self.completed)
+
+    def pause(self):
+        self.setCommand(PAUSED)
+
+    def resume(self):
+        self.setCommand(RUNNING)
+
+    def cancel(self):
+        self.setCommand(CANCELLED)
+
+    def setCommand(self, command):
+        if command not in (RUNNING, PAUSED, CANCELLED):
+            raise ValueError("Unknown run command.")
+        self.command = command
+        if self.control is not None:
+            self.control.value = command
+
+    def getCommand(self):
+        return self.command if self.control is None else self.control.value
+
+    def isPaused(self):
+        return self.getCommand() == PAUSED
+
+    def isCancelled(self):
+        return self.getCommand() == CANCELLED
+
     def getProgress(self):
         return self.progress
 
+    def isFailed(self):
+        return self.failure is not None
+
+    def getFailure(self):
+        return self.failure
+
     def isEmpty(self):
-        return not len(self.particles)
+        return not len(self.registry)
 
     def isActive(self):
         return self.is_alive()
+
+
+def computeScene(text, settings, name, shape, path, counter, control, results):
+    world = Simulation(1, 0.1)
+    world.loads(text)
+    for field in settings["externalfields"]:
+        world.addExternalField(field)
+    world.setEngine(settings["engine"])
+    world.collisions = settings["collisions"]
+    world.setReorderInterval(*settings["reorder"])
+    world.setStride(settings["stride"])
+    world.counter = counter
+    world.control = control
+
+    arena = TrajectoryArena.attach(name, shape, world.getDataType(), path)
+    if settings["tracing"]:
+        tracemalloc.start()
+    try:
+        world.allocateTrajectories(arena)
+        if settings["profile"] is not None:
+            profileCall(settings["profile"], world.integrate)
+        else:
+            world.integrate()
+        peak = tracemalloc.get_traced_memory()[1] if settings["tracing"] else None
+        results.put((world.getEvents(), peak))
+    finally:
+        for particle in world.particles:
+            particle.reset()
+        world.arena = None
+        arena.detach()